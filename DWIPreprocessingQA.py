@@ -74,10 +74,25 @@ class DWIPreprocessingQAWidget:
         self.nextButton.setText('Get next DWI')
         self.nextButton.connect('clicked(bool)', self.onGetBatchFilesClicked)
         self.dwiArtifactWidget = self.loadUIFile('Resources/UI/dwiArtifactWidget.ui')
+        # Gradients DTIPrep removed, from the headers of the raw and QCed DWI
+        self.preprocessingDiffLabel = qt.QLabel()
+        qaLayout.addWidget(self.preprocessingDiffLabel)
         qaLayout.addWidget(self.dwiArtifactWidget)
         qaLayout.addWidget(self.nextButton)
+        # Memory held by the sessions kept in the scene
+        self.sceneStatusLabel = qt.QLabel()
+        qaLayout.addWidget(self.sceneStatusLabel)
+        self.sceneStatusTimer = qt.QTimer()
+        self.sceneStatusTimer.connect('timeout()', self.updateSceneStatus)
+        self.sceneStatusTimer.start(2000)
         self.dwiWidget = slicer.modulewidget.qSlicerDiffusionWeightedVolumeDisplayWidget()
         qaLayout.addWidget(self.dwiWidget)
+        # The 4D image, read on request when the quick look volumes are shown
+        self.loadDWIButton = qt.QPushButton()
+        self.loadDWIButton.setText('Load full DWI')
+        self.loadDWIButton.setEnabled(False)
+        self.loadDWIButton.connect('clicked(bool)', self.onLoadDWIClicked)
+        qaLayout.addWidget(self.loadDWIButton)
         # Add all to layout
         self.layout.addWidget(self.dwiWidget)
         self.layout.addWidget(self.imageQAWidget)
@@ -85,6 +100,17 @@ class DWIPreprocessingQAWidget:
         self.enableRadios(self.images[0])
         self.logic.onGetBatchFilesClicked()
 
+    def updateSceneStatus(self):
+        """ Show the number of sessions kept in the MRML scene and the memory of their images """
+        text = self.logic.sceneNodes.describe()
+        if self.logic.quickLooks is not None:
+            text += ', ' + self.logic.quickLooks.describe()
+        self.sceneStatusLabel.setText(text)
+
+    def displayPreprocessingDiff(self, text):
+        """ Show the comparison of the raw and QCed gradient tables """
+        self.preprocessingDiffLabel.setText(text)
+
     def loadUIFile(self, fileName):
         """ Return the object defined in the Qt Designer file """
         uiloader = qt.QUiLoader()
@@ -263,6 +289,9 @@ class DWIPreprocessingQAWidget:
             # TODO: Handle this error intelligently
             return (-2, values)
 
+    def onLoadDWIClicked(self):
+        self.logic.loadDWI()
+
     def onGetBatchFilesClicked(self):
         (code, values) = self.checkValues()
         if code == 0:
@@ -71,14 +71,33 @@ class DWIrawQAWidget:
             reviewButton = self.reviewButtonFactory(question)
             qaLayout.addWidget(reviewButton)
             self.enableRadios(question)
+        # Gradient scheme checks, shown with the gradient list
+        self.gradientMetricsLabel = qt.QLabel()
+        qaLayout.addWidget(self.gradientMetricsLabel)
+        # Comments of the automated reviewer whose answers prefill the radios
+        self.autoReviewLabel = qt.QLabel()
+        self.autoReviewLabel.setWordWrap(True)
+        qaLayout.addWidget(self.autoReviewLabel)
         # DWI display widget
         self.dwiWidget = slicer.modulewidget.qSlicerDiffusionWeightedVolumeDisplayWidget()
         qaLayout.addWidget(self.dwiWidget)
+        # The 4D image, read on request when the quick look volumes are shown
+        self.loadDWIButton = qt.QPushButton()
+        self.loadDWIButton.setText('Load full DWI')
+        self.loadDWIButton.setEnabled(False)
+        self.loadDWIButton.connect('clicked(bool)', self.onLoadDWIClicked)
+        qaLayout.addWidget(self.loadDWIButton)
         # batch button
         self.nextButton = qt.QPushButton()
         self.nextButton.setText('Get next raw DWI')
         self.nextButton.connect('clicked(bool)', self.onGetBatchFilesClicked)
         qaLayout.addWidget(self.nextButton)
+        # Memory held by the sessions kept in the scene
+        self.sceneStatusLabel = qt.QLabel()
+        qaLayout.addWidget(self.sceneStatusLabel)
+        self.sceneStatusTimer = qt.QTimer()
+        self.sceneStatusTimer.connect('timeout()', self.updateSceneStatus)
+        self.sceneStatusTimer.start(2000)
         # Add all to layout
         self.layout.addWidget(self.imageQAWidget)
         self.layout.addWidget(self.dwiWidget)
@@ -88,6 +107,13 @@ class DWIrawQAWidget:
         # Initialize data
         self.logic.onGetBatchFilesClicked()
 
+    def updateSceneStatus(self):
+        """ Show the number of sessions kept in the MRML scene and the memory of their images """
+        text = self.logic.sceneNodes.describe()
+        if self.logic.quickLooks is not None:
+            text += ', ' + self.logic.quickLooks.describe()
+        self.sceneStatusLabel.setText(text)
+
     def loadUIFile(self, fileName):
         """ Return the object defined in the Qt Designer file """
         uiloader = qt.QUiLoader()
@@ -169,6 +195,23 @@ class DWIrawQAWidget:
                     else:
                         print "Resetting radio {0}...".format(radio.objectName)
 
+    def setRadioWidgets(self, values):
+        """ Check the answers of the automated review, a {question: value} dictionary; the reviewer can change them """
+        self.autoReviewLabel.setText('')
+        if not values:
+            return
+        for question in self.htmlFileName:
+            value = values.get(question)
+            if value is None:
+                continue
+            if value:
+                suffix = "_yes"
+            else:
+                suffix = "_no"
+            self.imageQAWidget.findChild("QRadioButton", question + suffix).setChecked(True)
+        if values.get('comments'):
+            self.autoReviewLabel.setText('Automated review: %s' % values['comments'])
+
     def getRadioValues(self):
         values = ()
         needsFollowUp = False
@@ -228,6 +271,9 @@ class DWIrawQAWidget:
             print values
         return (-2, values)
 
+    def onLoadDWIClicked(self):
+        self.logic.loadDWI()
+
     def onGetBatchFilesClicked(self):
         (code, values) = self.checkValues()
         if code == 0:
@@ -253,8 +299,10 @@ class DWIrawQAWidget:
             # TODO: clear scene
         self.gradientDisplayWidget.close()
 
-    def displayGradients(self, gradients):
+    def displayGradients(self, gradients, metrics=None):
         string = '\n'.join(item for item in gradients)
+        if metrics is not None:
+            self.gradientMetricsLabel.setText(metrics.describe())
         self.gradientDisplayWidget.setWindowTitle('Gradient directions: %s' % self.logic.sessionFile['file'])
         editor = self.gradientDisplayWidget.findChild('QTextEdit')
         editor.setText(string)
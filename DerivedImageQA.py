@@ -113,6 +113,16 @@ class DerivedImageQAWidget:
         self.layout.addWidget(self.navigationWidget)
         nLayout.addWidget(self.resetButton)
         nLayout.addWidget(self.batchButton)
+        # Review write-behind status
+        self.writerStatusLabel = qt.QLabel()
+        nLayout.addWidget(self.writerStatusLabel)
+        self.writerStatusTimer = qt.QTimer()
+        self.writerStatusTimer.connect('timeout()', self.updateWriterStatus)
+        self.writerStatusTimer.start(1000)
+        # Memory held by the sessions kept in the scene
+        self.sceneStatusLabel = qt.QLabel()
+        nLayout.addWidget(self.sceneStatusLabel)
+        self.writerStatusTimer.connect('timeout()', self.updateSceneStatus)
         self.layout.addWidget(self.imageQAWidget)
         self.layout.addStretch(1)
         print "Gui calling logic.onGetBatchFilesClicked()"
@@ -189,18 +199,11 @@ class DerivedImageQAWidget:
                 radio.setEnabled(False)
 
     def setRadioWidgets(self, values):
-        """ Set only the values given from the roboRater SELECT """
-        if values == []:
+        """ Set only the values given from the roboRater review, a {image: value} dictionary """
+        if not values:
             return
-        columns = self.logic.database.review_column_names
-        columns = [x[0] for x in columns]  # Flatten list of lists
-        valueDict = dict(zip(columns, values))
-        valueDict.pop('notes')  # HACK: Makes debugging easier
-        valueDict.pop('review_time')
-        valueDict.pop('review_id')
-        valueDict.pop('reviewer_id')
         radios = self.imageQAWidget.findChildren("QRadioButton")
-        for image, value in valueDict.items():
+        for image, value in values.items():
             if image not in self.images + self.regions:
                 continue
             self.enableRadios(image)
@@ -300,6 +303,38 @@ class DerivedImageQAWidget:
     def resetClipboard(self):
         self.clipboard.clear()
 
+    def updateWriterStatus(self):
+        """ Show the number of reviews waiting in the local journal and the latency of the last database write """
+        writer = self.logic.writer
+        if writer is None:  # Testing: reviews are not journaled
+            self.writerStatusLabel.setText('Reviews are written directly')
+            return
+        if writer.lastFlushLatency is None:
+            latency = 'n/a'
+        else:
+            latency = '%.0f ms' % (writer.lastFlushLatency * 1000)
+        text = 'Reviews pending: %d, last write: %s' % (writer.pendingCount(), latency)
+        toolTips = []
+        if writer.lastError is not None:
+            text += ' (retrying)'
+            toolTips.append(writer.lastError)
+        failed, conflicts = writer.failedCount(), writer.journal.conflicts()
+        if failed:
+            # Kept in the journal and retried at the next start
+            text += '\nReviews failed %d times: %d, retried at the next start' % (writer.maxAttempts, failed)
+        if conflicts:
+            text += '\nReviews refused by the database: %d, kept in %s' % (len(conflicts), writer.journal.path)
+            toolTips.extend('record %s: %s' % (values[0], reason) for journalID, values, reason in conflicts)
+        self.writerStatusLabel.setToolTip('\n'.join(toolTips))
+        self.writerStatusLabel.setText(text)
+
+    def updateSceneStatus(self):
+        """ Show the number of sessions kept in the MRML scene and the memory of their images """
+        text = self.logic.sceneNodes.describe()
+        if self.logic.volumeCache is not None:
+            text += ', ' + self.logic.volumeCache.describe()
+        self.sceneStatusLabel.setText(text)
+
     def onGetBatchFilesClicked(self):
         print "gui:onGetBatchFilesClicked()"
         values = self.getRadioValues()
@@ -314,14 +349,16 @@ class DerivedImageQAWidget:
 
     def exit(self):
         """ When Slicer exits, prompt user if they want to write the last evaluation """
+        self.writerStatusTimer.stop()  # The journal is closed by the logic
         values = self.getRadioValues()
-        if len(values) >= len(self.images + self.regions):
-            # TODO: Write a confirmation dialog popup
-            self.logic.writeToDatabase(values)
-        elif len(values) == 0:
-            self.logic.exit()
-        else:
-            # TODO: write a prompt window
-            print "Not enough values for the required columns!"
+        try:
+            if len(values) >= len(self.images + self.regions):
+                # TODO: Write a confirmation dialog popup
+                self.logic.writeToDatabase(values)
+            elif len(values) > 0:
+                # TODO: write a prompt window
+                print "Not enough values for the required columns!"
+                # TODO: clear scene
+        finally:
+            # Flushes the last review and releases the records claimed ahead by the prefetcher
             self.logic.exit()
-            # TODO: clear scene
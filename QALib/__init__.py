@@ -13,3 +13,12 @@ except ImportError:
     import pg8000
 
 sql = pg8000.DBAPI
+
+from .pool import getPool, closePools
+from .backends import PostgresBackend, SQLiteBackend
+from .queue_client import QueueClient, Row, AUTO_PREFIX, openQueue
+from .journal import ReviewJournal, ReviewWriter
+from .dircache import DirectoryCache
+from .resolution import ImageRule, ResolutionTable
+from .prefetch import PrefetchedSession, SessionPrefetcher
+from .scene import SessionNodeRegistry
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+import sqlite3
+
+from . import pg8000, sql
+from .pool import getPool
+
+
+class PostgresBackend(object):
+    """ Review queue statements for a Postgres server, through the vendored pg8000 and the shared
+        connection pool.  Each queue operation is a single statement and round trip
+    """
+    DataError = pg8000.errors.DataError
+
+    def __init__(self, host='localhost', port=5432, database=None, user='postgres', password='postgres',
+                 schema='autoworkup_scm'):
+        """
+        Arguments:
+        - `host`: The name of the host machine (default = 'localhost')
+        - `port`: The port number (default = 5432)
+        - `database`: The name of the database to connect to.  If omitted, it is the same as the `user`
+        - `user`: The username to connect to the Postgres server with, default is 'postgres'
+        - `password`: The password associated with the `user` on the Postgres server, default is 'postgres'
+        - `schema`: The schema holding the queue, review and reviewers tables
+        ------------------------
+        >>> backend = PostgresBackend(user='tester', password='test1')
+        >>> backend.database == 'tester' and backend.table('derived_images') == 'autoworkup_scm.derived_images'
+        True
+        """
+        sql.paramstyle = "qmark"
+        if database is None:
+            database = user
+        self.host = host
+        self.port = port
+        self.database = database
+        self.user = user
+        self.password = password
+        self.schema = schema
+        self.pool = getPool(host, port, database, user, password)
+
+    def table(self, name):
+        return '{0}.{1}'.format(self.schema, name)
+
+    def _execute(self, sqlCommand, params=(), fetch=True):
+        """ Run one statement on a pooled connection, commit it and return (column names, rows) """
+        connection = self.pool.acquire()
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sqlCommand, params)
+                names, rows = None, []
+                if fetch:
+                    names = [column[0] for column in cursor.description]
+                    rows = list(cursor.fetchall())
+                connection.commit()
+            finally:
+                cursor.close()
+        finally:
+            self.pool.release(connection)
+        return names, rows
+
+    def reviewerID(self, login):
+        names, rows = self._execute("SELECT reviewer_id FROM {0} WHERE login=?".format(self.table('reviewers')), (login,))
+        if not rows:
+            return None
+        return rows[0][0]
+
+    def claim(self, queueTable, limit, reviewTable=None, reviewColumns=(), autoReviewerID=None, prefix='auto_'):
+        """ Lock up to `limit` unreviewed rows, skipping rows being claimed concurrently, and return them with
+            the latest review by `autoReviewerID` (if given) joined in as `prefix`-named columns
+        """
+        queue = self.table(queueTable)
+        params = (limit,)
+        autoSelect = autoJoin = ""
+        if autoReviewerID is not None:
+            autoSelect = ", " + ", ".join(["auto.{0} AS {1}{0}".format(column, prefix)
+                                           for column in ('review_id',) + tuple(reviewColumns)])
+            autoJoin = "LEFT JOIN LATERAL (SELECT * \
+                                           FROM {review} \
+                                           WHERE {review}.record_id = claimed.record_id \
+                                             AND {review}.reviewer_id = ? \
+                                           ORDER BY review_time DESC \
+                                           LIMIT 1) AS auto ON TRUE".format(review=self.table(reviewTable))
+            params = params + (autoReviewerID,)
+        return self._execute("WITH claimed AS ( \
+                                  UPDATE {queue} \
+                                  SET status='L' \
+                                  WHERE record_id IN (SELECT record_id \
+                                                      FROM {queue} \
+                                                      WHERE status='U' \
+                                                      ORDER BY priority ASC, record_id ASC \
+                                                      LIMIT ? \
+                                                      FOR UPDATE SKIP LOCKED) \
+                                  RETURNING *) \
+                              SELECT claimed.*{autoSelect} \
+                              FROM claimed {autoJoin} \
+                              ORDER BY claimed.priority ASC, claimed.record_id ASC".format(queue=queue,
+                                                                                          autoSelect=autoSelect,
+                                                                                          autoJoin=autoJoin), params)
+
+    def unreviewed(self, queueTable):
+        """ Return (column names, rows) of every row with status == 'U', without locking them """
+        return self._execute("SELECT * FROM {0} WHERE status='U' \
+                              ORDER BY priority ASC, record_id ASC".format(self.table(queueTable)))
+
+    def records(self, queueTable):
+        """ Return (column names, rows) of every row whatever its status, without locking them """
+        return self._execute("SELECT * FROM {0} ORDER BY record_id ASC".format(self.table(queueTable)))
+
+    def setStatus(self, queueTable, recordIDs, status, fromStatus='L'):
+        """ Set the status of the listed records that currently have `fromStatus`, return the ids changed """
+        names, rows = self._execute("UPDATE {0} SET status=? \
+                                     WHERE record_id = ANY(?) AND status=? \
+                                     RETURNING record_id".format(self.table(queueTable)),
+                                    (status, list(recordIDs), fromStatus))
+        return [row[0] for row in rows]
+
+    def submit(self, queueTable, reviewTable, reviewColumns, values, reviewerID):
+        """ Mark the record reviewed and insert the review in one statement, only if the record is still locked,
+            so a replayed review is not written twice.  Return True if the review was written
+        """
+        valueString = ("?, " * len(values))[:-2]
+        # Nota bene: reviewer_id MUST be last in string
+        names, rows = self._execute("WITH released AS ( \
+                                         UPDATE {queue} SET status='R' \
+                                         WHERE record_id=? AND status='L' \
+                                         RETURNING record_id) \
+                                     INSERT INTO {review} \
+                                       (record_id, {columns}, reviewer_id) \
+                                     SELECT released.record_id, {qmarks} FROM released \
+                                     RETURNING record_id".format(
+                                         review=self.table(reviewTable), queue=self.table(queueTable),
+                                         columns=", ".join(reviewColumns), qmarks=valueString),
+                                    (values[0],) + tuple(values[1:]) + (reviewerID,))
+        return len(rows) > 0
+
+    def insertReview(self, reviewTable, reviewColumns, values, reviewerID):
+        """ Insert a review without changing the status of its record """
+        valueString = ("?, " * (len(values) + 1))[:-2]
+        self._execute("INSERT INTO {review} (record_id, {columns}, reviewer_id) VALUES ({qmarks})".format(
+                          review=self.table(reviewTable), columns=", ".join(reviewColumns), qmarks=valueString),
+                      tuple(values) + (reviewerID,), fetch=False)
+
+    def reviewedBy(self, reviewTable, reviewerID):
+        """ Return the record_ids with a review by `reviewerID` """
+        names, rows = self._execute("SELECT DISTINCT record_id FROM {0} WHERE reviewer_id=?".format(
+                                        self.table(reviewTable)), (reviewerID,))
+        return [row[0] for row in rows]
+
+
+class SQLiteBackend(object):
+    """ Local stand-in for the Postgres queue, e.g. a database created from Testing/databaseSQL.txt, so that
+        the queue logic can be exercised and benchmarked offline.  SQLite serializes writers, so claims take
+        the write lock up front (BEGIN IMMEDIATE) instead of using row locks
+    """
+    DataError = sqlite3.DataError
+    maxParameters = 500
+
+    def __init__(self, path, timeout=30.0):
+        """
+        Arguments:
+        - `path`: The SQLite database file
+        - `timeout`: Seconds to wait for another process holding the write lock
+        """
+        self.path = path
+        self.timeout = timeout
+
+    def table(self, name):
+        return name
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def _inList(self, recordIDs):
+        return "({0})".format(("?, " * len(recordIDs))[:-2])
+
+    def reviewerID(self, login):
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT reviewer_id FROM reviewers WHERE login=?", (login,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        return row[0]
+
+    def claim(self, queueTable, limit, reviewTable=None, reviewColumns=(), autoReviewerID=None, prefix='auto_'):
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                recordIDs = [row[0] for row in connection.execute("SELECT record_id FROM {0} \
+                                                                   WHERE status='U' \
+                                                                   ORDER BY priority ASC, record_id ASC \
+                                                                   LIMIT ?".format(queueTable), (limit,))]
+                if recordIDs:
+                    connection.execute("UPDATE {0} SET status='L' WHERE record_id IN {1}".format(
+                        queueTable, self._inList(recordIDs)), recordIDs)
+                autoSelect = autoJoin = ""
+                params = ()
+                if autoReviewerID is not None:
+                    autoSelect = ", " + ", ".join(["auto.{0} AS {1}{0}".format(column, prefix)
+                                                   for column in ('review_id',) + tuple(reviewColumns)])
+                    autoJoin = "LEFT JOIN {review} AS auto \
+                                ON auto.review_id = (SELECT max(review_id) FROM {review} \
+                                                     WHERE record_id = claimed.record_id \
+                                                       AND reviewer_id = ?)".format(review=reviewTable)
+                    params = (autoReviewerID,)
+                cursor = connection.execute("SELECT claimed.*{autoSelect} \
+                                             FROM {queue} AS claimed {autoJoin} \
+                                             WHERE claimed.record_id IN {ids} \
+                                             ORDER BY claimed.priority ASC, claimed.record_id ASC".format(
+                                                 autoSelect=autoSelect, queue=queueTable, autoJoin=autoJoin,
+                                                 ids=self._inList(recordIDs)), params + tuple(recordIDs))
+                names = [column[0] for column in cursor.description]
+                rows = cursor.fetchall()
+                connection.execute("COMMIT")
+            except:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.close()
+        return names, rows
+
+    def unreviewed(self, queueTable):
+        return self._select("SELECT * FROM {0} WHERE status='U' \
+                             ORDER BY priority ASC, record_id ASC".format(queueTable))
+
+    def records(self, queueTable):
+        return self._select("SELECT * FROM {0} ORDER BY record_id ASC".format(queueTable))
+
+    def _select(self, sqlCommand, params=()):
+        connection = self._connect()
+        try:
+            cursor = connection.execute(sqlCommand, params)
+            names = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        finally:
+            connection.close()
+        return names, rows
+
+    def setStatus(self, queueTable, recordIDs, status, fromStatus='L'):
+        recordIDs = list(recordIDs)
+        changed = []
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(recordIDs), self.maxParameters):
+                    chunk = recordIDs[start:start + self.maxParameters]
+                    inList = self._inList(chunk)
+                    changed.extend(row[0] for row in connection.execute(
+                        "SELECT record_id FROM {0} WHERE record_id IN {1} AND status=?".format(queueTable, inList),
+                        chunk + [fromStatus]))
+                    connection.execute("UPDATE {0} SET status=? WHERE record_id IN {1} AND status=?".format(
+                        queueTable, inList), [status] + chunk + [fromStatus])
+                connection.execute("COMMIT")
+            except:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.close()
+        return changed
+
+    def submit(self, queueTable, reviewTable, reviewColumns, values, reviewerID):
+        valueString = ("?, " * (len(values) + 1))[:-2]
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                released = connection.execute("UPDATE {0} SET status='R' WHERE record_id=? AND status='L'".format(
+                    queueTable), (values[0],)).rowcount > 0
+                if released:
+                    connection.execute("INSERT INTO {0} (record_id, {1}, reviewer_id) VALUES ({2})".format(
+                        reviewTable, ", ".join(reviewColumns), valueString), tuple(values) + (reviewerID,))
+                connection.execute("COMMIT")
+            except:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.close()
+        return released
+
+    def insertReview(self, reviewTable, reviewColumns, values, reviewerID):
+        valueString = ("?, " * (len(values) + 1))[:-2]
+        connection = self._connect()
+        try:
+            connection.execute("INSERT INTO {0} (record_id, {1}, reviewer_id) VALUES ({2})".format(
+                reviewTable, ", ".join(reviewColumns), valueString), tuple(values) + (reviewerID,))
+            connection.commit()
+        finally:
+            connection.close()
+
+    def reviewedBy(self, reviewTable, reviewerID):
+        names, rows = self._select("SELECT DISTINCT record_id FROM {0} WHERE reviewer_id=?".format(reviewTable),
+                                   (reviewerID,))
+        return [row[0] for row in rows]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+""" Pieces shared by the batch tools run outside Slicer (python -m QALib.preflight, dwiindex, dwirater and
+    quicklook): the command line, the directory cache and where the DWI queues keep their files
+"""
+import argparse
+import ConfigParser as cParser
+import os
+
+from . import __slicer_module__, DirectoryCache
+from .dwi_preprocess import helper as dwiImages
+from .dwi_raw import helper as dwiRaw
+
+
+def argumentParser(description, queues=None, verb='process'):
+    """ Return an ArgumentParser with the --database option and, if `queues` are given, the queue tables to
+        `verb` as positional arguments
+    """
+    parser = argparse.ArgumentParser(description=description)
+    if queues is not None:
+        parser.add_argument('queues', nargs='*', metavar='queue',
+                            help="The queue tables to {0}: {1} (default: all)".format(verb, ', '.join(queues)))
+    parser.add_argument('--database', default=os.environ.get('QA_DB_CONFIG',
+                                                             os.path.join(__slicer_module__, 'autoworkup.cfg')),
+                        help="Database configuration (default: $QA_DB_CONFIG, else autoworkup.cfg)")
+    return parser
+
+
+def parseArguments(parser, argv=None, queues=None):
+    """ Parse the command line of an argumentParser() and read the database configuration.  Return the
+        arguments, with all the `queues` if none were listed, and the database ConfigParser
+
+    >>> parser = argumentParser('Test', queues=('dwi_raw', 'dwi_images'))
+    >>> args, databaseConfig = parseArguments(parser, ['--database', os.devnull], ('dwi_raw', 'dwi_images'))
+    >>> args.queues
+    ['dwi_raw', 'dwi_images']
+    """
+    args = parser.parse_args(argv)
+    if queues is not None:
+        for queue in args.queues:
+            if queue not in queues:
+                parser.error("Unknown queue {0}".format(queue))
+        args.queues = args.queues or list(queues)
+    databaseConfig = cParser.SafeConfigParser()
+    if not databaseConfig.read(args.database):
+        parser.error("File {0} not found!".format(args.database))
+    return args, databaseConfig
+
+
+def directoryCache():
+    """ A DirectoryCache for one run over a whole queue: listings are kept for an hour instead of being
+        checked for changes every few seconds
+    """
+    return DirectoryCache(maxEntries=4096, checkInterval=3600.0)
+
+
+def dwiRawLocator(cache):
+    """ Return a function of a dwi_raw row giving its NRRD file, or None """
+    def locate(row):
+        path = dwiRaw.sessionFilePath(row)
+        if cache.exists(path):
+            return path
+        return None
+    return locate
+
+
+def dwiImagesLocator(cache):
+    """ Return a function of a dwi_images row giving its DTIPrep output, or None """
+    def locate(row):
+        matching = cache.matching(dwiImages.sessionDirectory(row), dwiImages.QCED_SUFFIX)
+        if matching:
+            return matching[0]
+        return None
+    return locate
+
+
+def dwiLocators(cache):
+    """ Return {queue table: (QUEUE defaults, locator)} of the two DWI queues """
+    return {'dwi_raw': (dwiRaw.QUEUE, dwiRawLocator(cache)),
+            'dwi_images': (dwiImages.QUEUE, dwiImagesLocator(cache))}
@@ -1,4 +1,5 @@
-from .. import __slicer_module__, pg8000, sql
+from .. import __slicer_module__, closePools, openQueue, AUTO_PREFIX, ReviewJournal, ReviewWriter, DirectoryCache, ResolutionTable, \
+    SessionPrefetcher, SessionNodeRegistry
 from helper import *
 from logic import *
 
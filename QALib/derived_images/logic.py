@@ -1,12 +1,17 @@
 import os
 from warnings import warn
 
-from __main__ import ctk
-from __main__ import qt
-from __main__ import slicer
-from __main__ import vtk
+try:
+    from __main__ import ctk
+    from __main__ import qt
+    from __main__ import slicer
+    from __main__ import vtk
+except:
+    pass
 
-from . import __slicer_module__, postgresDatabase
+from . import __slicer_module__, closePools, openQueue, QUEUE, AUTO_PREFIX, ReviewJournal, ReviewWriter, DirectoryCache, ResolutionTable, FALLBACKS, sessionDirectory
+from . import SessionPrefetcher, SessionNodeRegistry
+from .. import volumes
 
 try:
     import ConfigParser as cParser
@@ -27,7 +32,18 @@ class DerivedImageQALogic(object):
         self.qaValueMap = {'good':'1', 'bad':'0', 'follow up':'-1'}
         self.user_id = None
         self.database = None
+        self.writer = None
+        self.prefetcher = None
+        self.prefetchedVolumes = {}
+        self.labelBoxes = {}  # all_Labels_seg node name -> {label: bounding box}
         self.config = None
+        self.resolution = None
+        self.regionDisplay = 'lookup_table'
+        self.prewarmRegions = False
+        self.regionNodes = {}  # region -> label node of the current session, created on first use
+        self.currentReviewValues = {}
+        self.sceneNodes = None  # SessionNodeRegistry of the nodes each session added to the scene
+        self.volumeCache = None
         self.batchSize = 1
         self.batchRows = None
         self.count = 0 # Starting value
@@ -35,6 +51,7 @@ class DerivedImageQALogic(object):
         self.currentSession = None
         self.currentValues = (None,) * len(self.images + self.regions)
         self.sessionFiles = {}
+        self.directoryCache = DirectoryCache()
         self.testing = test
         if self.testing:
             self.logging.info("TESTING is ON")
@@ -60,21 +77,94 @@ class DerivedImageQALogic(object):
             if not os.path.exists(configFile):
                 raise IOError("File {0} not found!".format(configFile))
         config.read(databaseConfig)
-        host = config.get('Postgres', 'Host')
-        port = config.getint('Postgres', 'Port')
-        database = config.get('Postgres', 'Database')
-        db_user = config.get('Postgres', 'User')
-        password = config.get('Postgres', 'Password')
+        self.config.read(logicConfig)
+        self.logging.info("logic.py: Reading logic configuration from %s", logicConfig)
+        # Raises ValueError here, not mid-batch, if the module configuration is malformed
+        self.resolution = ResolutionTable.fromConfig(self.config, self.images + self.regions, FALLBACKS)
+        if self.config.has_option('Display', 'regions'):
+            self.regionDisplay = self.config.get('Display', 'regions')
+        if self.regionDisplay not in ('lookup_table', 'volumes'):
+            raise ValueError("[Display] regions must be 'lookup_table' or 'volumes': %s" % self.regionDisplay)
+        self.logging.info("logic.py: Displaying label regions with %s", self.regionDisplay)
+        if self.config.has_option('Display', 'prewarm'):
+            self.prewarmRegions = self.config.getboolean('Display', 'prewarm')
+        sessionWindow = 2  # Current and previous session
+        if self.config.has_option('Display', 'session_window'):
+            sessionWindow = self.config.getint('Display', 'session_window')
+        self.sceneNodes = SessionNodeRegistry(slicer.mrmlScene, sessionWindow)
         ## TODO: Use secure password handling (see RunSynchronization.py in phdxnat project)
         #        import hashlib as md5
         #        md5Password = md5.new(password)
         ### HACK
         if not self.testing:
-            self.database = postgresDatabase(host, port, db_user, database, password,
-                                             self.user_id, self.batchSize)
+            self.database = openQueue(config, QUEUE, self.user_id, self.batchSize, moduleConfig=self.config)
+            # Reviews are journaled locally and written by a background thread with its own client
+            journalFile = os.path.join(os.environ['TMPDIR'], 'DerivedImageQA_{0}_reviews.sqlite'.format(self.user_id))
+            self.logging.info("logic.py: Journaling reviews to %s", journalFile)
+            writerDatabase = openQueue(config, QUEUE, self.user_id, self.batchSize, moduleConfig=self.config)
+            self.writer = ReviewWriter(ReviewJournal(journalFile), writerDatabase)
+            self.writer.start()
+            self.openVolumeCache()
+            self.startPrefetcher(config)
         ### END HACK
-        self.config.read(logicConfig)
-        self.logging.info("logic.py: Reading logic configuration from %s", logicConfig)
+
+
+    def openVolumeCache(self):
+        """ Keep decompressed copies of the session files on local scratch, as set in the [Cache] section of the module
+            configuration (enabled, directory = default $TMPDIR/SlicerQA_volumes, max_size_gb = default 8)
+        """
+        enabled, directory, maxSize = True, os.path.join(os.environ['TMPDIR'], 'SlicerQA_volumes'), 8.0
+        if self.config.has_section('Cache'):
+            if self.config.has_option('Cache', 'enabled'):
+                enabled = self.config.getboolean('Cache', 'enabled')
+            if self.config.has_option('Cache', 'directory'):
+                directory = self.config.get('Cache', 'directory')
+            if self.config.has_option('Cache', 'max_size_gb'):
+                maxSize = self.config.getfloat('Cache', 'max_size_gb')
+        if not enabled:
+            return
+        if not volumes.canRead():
+            self.logging.info("SimpleITK not found: the volume cache is disabled")
+            return
+        self.volumeCache = volumes.VolumeCache(directory, int(maxSize * 1024 ** 3))
+        self.logging.info("logic.py: Caching decompressed volumes in %s, up to %.1f GB", directory, maxSize)
+
+
+    def _readVolume(self, filename):
+        """ Return the DecodedVolume of a file decoded ahead by the prefetcher or read through the volume cache, or None
+            to load it with Slicer.  On a cache miss the file is decompressed once, here, and the same image is written
+            to the cache in the background
+        """
+        volume = self.prefetchedVolumes.pop(filename, None)
+        if volume is None and self.volumeCache is not None:
+            volume = self.volumeCache.readVolume(filename, storeLater=True)
+        return volume
+
+
+    def startPrefetcher(self, databaseConfig):
+        """ Claim and read the next sessions ahead of the reviewer, as set in the [Prefetch] section of the
+            module configuration (depth = sessions kept ready, 0 to disable; memory_budget_mb = decoded voxels)
+        """
+        depth, memoryBudget = 1, 1024
+        if self.config.has_section('Prefetch'):
+            if self.config.has_option('Prefetch', 'depth'):
+                depth = self.config.getint('Prefetch', 'depth')
+            if self.config.has_option('Prefetch', 'memory_budget_mb'):
+                memoryBudget = self.config.getint('Prefetch', 'memory_budget_mb')
+        if depth < 1:
+            return
+        read = None
+        if self.volumeCache is not None:
+            read = self.volumeCache.readVolume
+        elif volumes.canRead():
+            read = volumes.readVolume
+        else:
+            self.logging.info("SimpleITK not found: records are claimed ahead, but volumes are read when shown")
+        prefetchDatabase = openQueue(databaseConfig, QUEUE, self.user_id, self.batchSize, moduleConfig=self.config)
+        self.prefetcher = SessionPrefetcher(prefetchDatabase, self.constructFilePaths, self.images + self.regions,
+                                            read, depth, memoryBudget * 1024 ** 2)
+        self.prefetcher.start()
+        self.logging.info("Prefetching %d session(s) ahead, up to %d MB", depth, memoryBudget)
 
 
     def selectRegion(self, buttonName):
@@ -84,7 +174,13 @@ class DerivedImageQALogic(object):
         nodeName = self.constructLabelNodeName(buttonName)
         if nodeName == '':
             return -1
-        labelNode = slicer.util.getNode(nodeName)
+        if buttonName in self.regions:
+            labelNode = self.regionNode(buttonName)
+            level = self.resolution.rule(buttonName).label
+            if level is not None and self.regionDisplay == 'lookup_table':
+                self.showLabelLevel(labelNode, level)
+        else:
+            labelNode = slicer.util.getNode(nodeName)
         if labelNode.GetLabelMap():
             compositeNodes = slicer.util.getNodes('vtkMRMLSliceCompositeNode*')
             for compositeNode in compositeNodes.values():
@@ -98,6 +194,61 @@ class DerivedImageQALogic(object):
              self.loadBackgroundNodeToMRMLScene(labelNode)
 
 
+    def regionNode(self, region):
+        """ Return the label node of a region of the current session, creating it the first time it is asked for """
+        labelNode = self.regionNodes.get(region)
+        if labelNode is None:
+            nodeName = self.constructLabelNodeName(region)
+            level = self.resolution.rule(region).label  # Threshold value for all_Labels_seg.nii.gz
+            if level is None:  # TissueClassify image
+                labelNode = self.loadLabelVolume(nodeName, self.sessionFiles[region])
+            elif self.regionDisplay == 'lookup_table':  # Regions are colored in selectRegion
+                labelNode = self._allLabelsNode(self.sessionFiles[region], self.currentSession)
+            else:  # uses all_Labels_seg.nii.gz
+                self._all_Labels_seg(self.sessionFiles[region], nodeName=nodeName, level=level, session=self.currentSession)
+                labelNode = slicer.util.getNode(nodeName)
+            self.regionNodes[region] = labelNode
+        return labelNode
+
+
+    def prewarm(self, regions):
+        """ Create the label nodes of `regions` one at a time while the main thread is idle, stopping if the session
+            changes
+        """
+        session = self.currentSession
+        pending = list(regions)
+
+        def prewarmNext():
+            if not pending or self.currentSession != session:
+                return
+            self.regionNode(pending.pop(0))
+            qt.QTimer.singleShot(0, prewarmNext)
+        qt.QTimer.singleShot(0, prewarmNext)
+
+
+    def showLabelLevel(self, labelNode, level):
+        """ Make only `level` of a label volume visible by switching its display to a generated color table in which
+            every other label is transparent.  The table is shared by all sessions and rewritten on each call
+        """
+        colorNode = slicer.util.getNode('QARegionColors')
+        size = max(256, max(rule.label for rule in self.resolution.rules if rule.label is not None) + 1)
+        if colorNode is None:
+            colorNode = slicer.vtkMRMLColorTableNode()
+            colorNode.SetName('QARegionColors')
+            colorNode.SetTypeToUser()
+            colorNode.SetHideFromEditors(True)
+            colorNode.SetNumberOfColors(size)
+            slicer.mrmlScene.AddNode(colorNode)
+        labelColors = slicer.mrmlScene.GetNodeByID('vtkMRMLColorTableNodeLabels').GetLookupTable()
+        wasModifying = colorNode.StartModify()
+        for entry in range(colorNode.GetNumberOfColors()):
+            colorNode.SetColor(entry, 0.0, 0.0, 0.0, 0.0)
+        red, green, blue, alpha = labelColors.GetTableValue(level % labelColors.GetNumberOfTableValues())
+        colorNode.SetColor(level, red, green, blue, 1.0)
+        colorNode.EndModify(wasModifying)
+        labelNode.GetDisplayNode().SetAndObserveColorNodeID(colorNode.GetID())
+
+
     def constructLabelNodeName(self, buttonName):
         """ Create the names for the volume and label nodes """
         self.logging.debug("call")
@@ -119,14 +270,13 @@ class DerivedImageQALogic(object):
         if self.testing:
             recordID = str(self.batchRows[self.count]['record_id'])
         else:
-            recordID = self.batchRows[self.count][0]
+            recordID = self.batchRows[self.count]['record_id']
         values = (recordID,) + evaluations
         try:
             if self.testing:
                 self.database.writeAndUnlockRecord(values)
             else:
-                self.database.writeReview(values)
-                self.database.unlockRecord('R', recordID)
+                self.writer.submit(values)
         except:
             # TODO: Prompt user with popup
             self.logging.error("Error writing to database for record %d", recordID)
@@ -148,24 +298,40 @@ class DerivedImageQALogic(object):
         """ """
         self.logging.debug("call")
         self.count = 0
-        self.batchRows = self.database.lockAndReadRecords()
+        prefetched = None
+        if self.prefetcher is not None:
+            prefetched = self.prefetcher.take()
+        if prefetched is not None:
+            row, self.sessionFiles, self.prefetchedVolumes = prefetched
+        else:
+            # Sessions with missing files are marked 'M' in bulk until a complete one is claimed
+            row, self.sessionFiles = self.database.claimCompleteRecord(self.constructFilePaths)
+            self.prefetchedVolumes = {}
+        self.labelBoxes = {}
+        self.batchRows = [row]
         self.maxCount = len(self.batchRows)
-        self.constructFilePaths()
         self.setCurrentSession()
         self.loadData()
-        reviewColumnsCount = 8
-        print self.batchRows[self.count]
-        if len(self.batchRows[self.count]) > reviewColumnsCount:
-            # roboRater has done this already
-            self.currentReviewValues = self.batchRows[self.count][reviewColumnsCount:]
-        else:
-            self.currentReviewValues = []
+        self.currentReviewValues = self.getAutomatedReviewValues(self.batchRows[self.count])
+        if self.prewarmRegions:
+            # Regions already rated by roboRater are disabled in the widget and rarely opened
+            self.prewarm([region for region in self.regions if self.currentReviewValues.get(region) is None])
+
+
+    def getAutomatedReviewValues(self, row):
+        """ Return a {image: value} dictionary of the roboRater review joined to the row, empty if there is none """
+        self.logging.debug("call")
+        if row.get(AUTO_PREFIX + 'review_id') is None:
+            return {}
+        return dict((image, row[AUTO_PREFIX + image]) for image in self.images + self.regions)
 
 
     def setCurrentSession(self):
         self.logging.debug("call")
         self.currentSession = self.sessionFiles['session']
         self.widget.currentSession = self.currentSession
+        self.regionNodes = {}
+        self.sceneNodes.activate(self.currentSession)
 
 
     def _all_Labels_seg(self, oldfilename, nodeName, level, session):
@@ -174,131 +340,81 @@ class DerivedImageQALogic(object):
         CleanedDenoisedRFSegmentations folder, not the combined all_Labels_seg file which has the final segmentations after
         competition.  Load the correct labels from all_Labels_seg.nii.gz and have the corresponding labels display for each label
         choice in the module.
+
+        All labels are located with a single pass over all_Labels_seg per session, and each region gets a label volume the
+        size of its bounding box only, placed where the box lies in all_Labels_seg.
         """
         print "_all_Labels_seg()"
-        import numpy
+        from ..labels import labelBoxes, regionMask
+        allLabelName = 'allLabels_seg_{0}'.format(session)
+        labelNode = self._allLabelsNode(oldfilename, session)
+        la = slicer.util.array(labelNode.GetID())
+        if allLabelName not in self.labelBoxes:
+            self.labelBoxes[allLabelName] = labelBoxes(la)
+        box = self.labelBoxes[allLabelName].get(level)
+        if box is None:  # Label missing from this session: a single empty voxel
+            box = (slice(0, 1),) * la.ndim
+        outputLabelNode = volumes.pushRegion(nodeName, regionMask(la, level, box), labelNode, box)
+        self.sceneNodes.register(session, outputLabelNode)
+
+
+    def _allLabelsNode(self, fileName, session):
+        """ Return the all_Labels_seg node of a session, loading it the first time """
         allLabelName = 'allLabels_seg_{0}'.format(session)
         labelNode = slicer.util.getNode(allLabelName)
         if labelNode is None:
-            labelNode = self.loadLabelVolume(allLabelName, oldfilename)
-        la = slicer.util.array(labelNode.GetID())
-        outputLabelNode = slicer.modules.volumes.logic().CloneVolume(slicer.mrmlScene, labelNode, nodeName)
-        ma = slicer.util.array(outputLabelNode.GetID())
-        mask = numpy.ndarray.copy(la)
-        mask[mask != level] = 0
-        mask[mask == level] = 1
-        ma[:] = mask
-        outputLabelNode.GetImageData().Modified()
+            labelNode = self.loadLabelVolume(allLabelName, fileName)
+        return labelNode
 
 
-    def constructFilePaths(self):
-        """
+    def constructFilePaths(self, row):
+        """ Return the session files of a claimed row, or None if any required file is missing.  A missing T2
+            is replaced by an empty image (T1-only session)
+
         >>> import DerivedImagesQA as diqa
         External modules not found!
         /Volumes/scratch/welchdm/src/Slicer-extensions/SlicerQAExtension
         External modules not found!
         >>> test = diqa.DerivedImageQAWidget(None, True)
         Testing logic is ON
-        >>> test.logic.count = 0 ### HACK
-        >>> test.logic.batchRows = [['rid','exp', 'site', 'sbj', 'ses', 'loc']] ### HACK
-        >>> test.logic.constructFilePaths()
-        Test: loc/exp/site/sbj/ses/TissueClassify/t1_average_BRAINSABC.nii.gz
-        File not found for file: t2_average
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/TissueClassify/t1_average_BRAINSABC.nii.gz
-        File not found for file: t1_average
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/TissueClassify/fixed_brainlabels_seg.nii.gz
-        File not found for file: labels_tissue
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/l_caudate_seg.nii.gz
-        File not found for file: caudate_left
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/r_caudate_seg.nii.gz
-        File not found for file: caudate_right
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/l_accumben_seg.nii.gz
-        File not found for file: accumben_left
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/r_accumben_seg.nii.gz
-        File not found for file: accumben_right
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/l_putamen_seg.nii.gz
-        File not found for file: putamen_left
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/r_putamen_seg.nii.gz
-        File not found for file: putamen_right
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/l_globus_seg.nii.gz
-        File not found for file: globus_left
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/r_globus_seg.nii.gz
-        File not found for file: globus_right
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/l_thalamus_seg.nii.gz
-        File not found for file: thalamus_left
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/r_thalamus_seg.nii.gz
-        File not found for file: thalamus_right
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/l_hippocampus_seg.nii.gz
-        File not found for file: hippocampus_left
-        Skipping session...
-        Test: loc/exp/site/sbj/ses/DenoisedRFSegmentations/r_hippocampus_seg.nii.gz
-        File not found for file: hippocampus_right
-        Skipping session...
+        >>> row = {'record_id':'rid', '_analysis':'exp', '_project':'site', '_subject':'sbj', '_session':'ses', 'location':'loc'}
+        >>> test.logic.constructFilePaths(row) is None
+        True
         """
         self.logging.debug("call")
-        row = self.batchRows[self.count]
         sessionFiles = {}
-        # Due to a poor choice in our database creation, the 'location' column is the 6th, NOT the 2nd
-        baseDirectory = os.path.join(row[5], row[1], row[2], row[3], row[4])
-        sessionFiles['session'] = row[4]
-        sessionFiles['record_id'] = row[0]
-
-        for image in self.images + self.regions:
-            imageDirs = eval(self.config.get(image, 'directories'))
-            imageFiles = eval(self.config.get(image, 'filenames'))
-            for _dir in imageDirs:
-                for _file in imageFiles:
-                    temp = os.path.join(baseDirectory, _dir, _file)
-                    if self.testing:
-                        print "**** Test: ", temp
-                    if os.path.exists(temp):
-                        sessionFiles[image] = temp
-                        break; break
-                    elif image == 't2_average':  # Assume this is a T1-only session
-                        sessionFiles[image] = os.path.join(__slicer_module__, 'Resources', 'images', 'emptyImage.nii.gz')
-                        break; break
-                    else:
-                        sessionFiles[image] = None
-                        print "**** File not found: %s" % temp
-            if sessionFiles[image] is None:
-                self.logging.info("Skipping session %s", sessionFiles['session'])
-                # raise IOError("File not found!\nFile: %s" % sessionFiles[image])
-                if not self.testing:
-                    self.database.unlockRecord('M', sessionFiles['record_id'])
-                    self.logging.debug("image = %s", image)
-                break
-        if None in sessionFiles.values():
-            self.logging.debug("'None' value in sessionFiles - recursive call initiated")
-            self.onGetBatchFilesClicked()
-        else:
-            self.sessionFiles = sessionFiles
+        baseDirectory = sessionDirectory(row)
+        sessionFiles['session'] = row['_session']
+        sessionFiles['record_id'] = row['record_id']
+
+        # One directory read per distinct directory instead of one stat per candidate
+        files, missing = self.resolution.resolve(baseDirectory, self.directoryCache.find)
+        if missing is not None:
+            self.logging.info("Skipping session %s: no file found for %s in %s", sessionFiles['session'], missing,
+                              self.resolution.rule(missing).candidates)
+            return None
+        sessionFiles.update(files)
+        return sessionFiles
 
 
     def loadScalarVolume(self, nodeName, filename):
+        volume = self._readVolume(filename)
+        if volume is not None:
+            return self.sceneNodes.register(self.currentSession, volumes.pushVolume(nodeName, volume))
         isLoaded, volumeNode = slicer.util.loadVolume(filename, properties={'name':nodeName}, returnNode=True)
         assert isLoaded, "File failed to load: {0}".format(filename)
         volumeNode.GetDisplayNode().AutoWindowLevelOn()
-        return volumeNode
+        return self.sceneNodes.register(self.currentSession, volumeNode)
 
 
     def loadLabelVolume(self, nodeName, filename):
         """ Load a label volume into the MRML scene and set the display node """
+        volume = self._readVolume(filename)
+        if volume is not None:
+            return self.sceneNodes.register(self.currentSession, volumes.pushVolume(nodeName, volume, labelMap=True))
         isLoaded, volumeNode = slicer.util.loadLabelVolume(filename, properties={'labelmap':True, 'name':nodeName}, returnNode=True)
         assert isLoaded, "File failed to load: {0}".format(filename)
-        return volumeNode
+        return self.sceneNodes.register(self.currentSession, volumeNode)
 
 
     def loadData(self):
@@ -312,13 +428,7 @@ class DerivedImageQALogic(object):
         self.loadScalarVolume(t1NodeName, self.sessionFiles['t1_average'])
         t2NodeName = '%s_t2_average' % self.currentSession
         self.loadScalarVolume(t2NodeName, self.sessionFiles['t2_average'])
-        for image in self.regions:
-            regionNodeName = "%s_%s" % (self.currentSession, image)
-            if self.config.has_option(image, 'label'):  # uses all_Labels_seg.nii.gz
-                imageThreshold = eval(self.config.get(image, 'label'))  # Threshold value for all_Labels_seg.nii.gz
-                self._all_Labels_seg(self.sessionFiles[image], nodeName=regionNodeName, level=imageThreshold, session=self.currentSession)  # Create nodes in mrmlScene
-            else:  # TissueClassify image
-                self.loadLabelVolume(regionNodeName, self.sessionFiles[image])
+        # Region label nodes are created by regionNode() when a region is first selected
         dataDialog.close()
 
 
@@ -392,14 +502,36 @@ class DerivedImageQALogic(object):
 
     def loadNewSession(self):
         self.logging.debug("call")
-        self.constructFilePaths()
+        self.sessionFiles = self.constructFilePaths(self.batchRows[self.count])
+        if self.sessionFiles is None:
+            raise IOError("Files for record %s are no longer available" % self.batchRows[self.count]['record_id'])
         self.setCurrentSession()
         self.loadData()
 
 
     def exit(self):
         self.logging.debug("call")
-        self.database.unlockRecord('U')
+        pending = set()
+        if self.writer is not None:  # Not in testing
+            if not self.writer.flush(timeout=10.0):
+                self.logging.warning("%d review(s) left in the journal %s", self.writer.journal.count(), self.writer.journal.path)
+            # Records with a journaled review stay locked until the review is written
+            pending = self.writer.journal.pendingRecordIDs()
+            # Nothing may still be writing when the pools are closed
+            self.writer.stop(timeout=10.0)
+            if self.writer.is_alive():
+                self.logging.warning("The review writer is still writing, the journal is left open")
+            else:
+                self.writer.journal.close()
+        recordIDs = [row['record_id'] for row in (self.batchRows or []) if row['record_id'] not in pending]
+        if self.prefetcher is not None:
+            recordIDs.extend(self.prefetcher.stop(timeout=10.0))
+        if self.database is not None:
+            released = self.database.unlockRecords(recordIDs)
+            self.logging.info("Released %d locked record(s)", len(released))
+        if self.volumeCache is not None:
+            self.logging.info("Volume %s", self.volumeCache.describe())
+        closePools()
 
 
 # if __name__ == '__main__':
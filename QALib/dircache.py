@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+import collections
+import os
+import threading
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir  # Backport of os.scandir for Python 2
+    except ImportError:
+        scandir = None
+
+
+def _scan(directory):
+    """ Return the names in `directory` with a single directory read """
+    if scandir is not None:
+        return frozenset(entry.name for entry in scandir(directory))
+    return frozenset(os.listdir(directory))
+
+
+class DirectoryCache(object):
+    """ Cache of directory listings, so that resolving many candidate files in the same session directory
+        costs one directory read instead of one stat per candidate (each one a round trip on NFS).  A listing
+        older than `checkInterval` seconds is revalidated against the directory mtime before it is reused
+    """
+
+    def __init__(self, maxEntries=256, checkInterval=1.0):
+        """
+        Arguments:
+        - `maxEntries`: The number of directory listings kept, least recently used are dropped first
+        - `checkInterval`: Seconds a listing is trusted before the directory mtime is checked again
+        ------------------------
+        >>> import tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> cache = DirectoryCache(checkInterval=0)
+        >>> open(os.path.join(directory, 'a_QCed.nrrd'), 'w').close()
+        >>> cache.find([os.path.join(directory, 'b.nrrd'), os.path.join(directory, 'a_QCed.nrrd')]) == os.path.join(directory, 'a_QCed.nrrd')
+        True
+        >>> cache.exists(os.path.join(directory, 'missing', 'c.nrrd')), cache.misses
+        (False, 2)
+        >>> cache.exists(os.path.join(directory, 'b.nrrd')), cache.hits
+        (False, 2)
+        """
+        self.maxEntries = maxEntries
+        self.checkInterval = checkInterval
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # directory -> (mtime, checked time, names)
+        self._lock = threading.Lock()
+
+    def _mtime(self, directory):
+        try:
+            return os.stat(directory).st_mtime
+        except OSError:
+            return None
+
+    def listing(self, directory):
+        """ Return the frozenset of names in `directory`, empty if it does not exist """
+        directory = os.path.normpath(directory)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(directory, None)
+        if entry is not None:
+            mtime, checked, names = entry
+            if now - checked >= self.checkInterval and self._mtime(directory) == mtime:
+                checked = now
+            if checked == now or now - checked < self.checkInterval:
+                self.hits += 1
+                with self._lock:
+                    self._entries[directory] = (mtime, checked, names)
+                return names
+        self.misses += 1
+        mtime = self._mtime(directory)
+        try:
+            names = _scan(directory) if mtime is not None else frozenset()
+        except OSError:
+            names = frozenset()
+        with self._lock:
+            self._entries[directory] = (mtime, now, names)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+        return names
+
+    def exists(self, path):
+        directory, name = os.path.split(path)
+        return name in self.listing(directory)
+
+    def find(self, candidates):
+        """ Return the first of the `candidates` paths that exists, or None """
+        for path in candidates:
+            if self.exists(path):
+                return path
+        return None
+
+    def matching(self, directory, suffix):
+        """ Return the sorted paths in `directory` whose names end with `suffix` """
+        return [os.path.join(directory, name) for name in sorted(self.listing(directory)) if name.endswith(suffix)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
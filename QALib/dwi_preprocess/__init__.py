@@ -1,4 +1,7 @@
-from .. import __slicer_module__, pg8000, sql
+from .. import __slicer_module__, closePools, openQueue, DirectoryCache, SessionNodeRegistry
+from ..dwi_raw.gradients import GradientTableCache
+from ..dwi_raw.summary import QuickLookCache, openQuickLookCache
+from comparison import PreprocessingDiff, compareGradients
 from helper import *
 from logic import *
 
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+""" Header level comparison of a raw DWI and its DTIPrep QCed output: the gradients DTIPrep excluded, the
+    volumes left in every shell and how well the remaining directions still cover the sphere.  Only the
+    gradient tables are read, so a failed preprocessing shows before any voxel is loaded
+"""
+import collections
+
+import numpy
+
+
+class PreprocessingDiff(collections.namedtuple('PreprocessingDiff', ('rawCount', 'qcedCount', 'removed',
+                                                                     'unmatched', 'baselines', 'shells'))):
+    """ - `removed`: The indices of the raw gradients missing from the QCed table
+        - `unmatched`: The indices of the QCed gradients that match no raw gradient
+        - `baselines`: (raw count, QCed count)
+        - `shells`: ((b-value, raw count, QCed count, coverage gap), ...), where the gap is the largest angle
+          (degrees, antipodally symmetric) from a raw direction of the shell to the nearest remaining one
+    """
+    __slots__ = ()
+
+    def describe(self):
+        """ Lines for the module panel """
+        removed = ', '.join(str(index) for index in self.removed) or 'none'
+        lines = ['Removed by DTIPrep: %d of %d volume(s): %s' % (len(self.removed), self.rawCount, removed),
+                 'Baselines: %d -> %d' % self.baselines]
+        for shell in self.shells:
+            lines.append('b=%g: %d -> %d, largest direction gap %.1f deg' % shell)
+        if self.unmatched:
+            lines.append('Not in the raw DWI: %s' % ', '.join(str(index) for index in self.unmatched))
+        return '\n'.join(lines)
+
+
+def _shellsAndDirections(gradients, bValue, baselineB, shellTolerance):
+    """ Return the shell of every gradient (0 for the baselines) and its unit direction """
+    gradients = numpy.asarray(gradients, dtype=numpy.float64).reshape(-1, 3)
+    norms = numpy.sqrt((gradients ** 2).sum(axis=1))
+    bValues = (bValue or 0.0) * norms ** 2
+    shells = numpy.where(bValues > baselineB, numpy.round(bValues / shellTolerance) * shellTolerance, 0.0)
+    directions = numpy.zeros_like(gradients)
+    weighted = shells > 0
+    directions[weighted] = gradients[weighted] / norms[weighted, numpy.newaxis]
+    return shells, directions
+
+
+def compareGradients(rawGradients, rawBValue, qcedGradients, qcedBValue, baselineB=50.0, shellTolerance=100.0,
+                     angleTolerance=5.0):
+    """ Match the QCed gradients to the raw ones by vector and return the PreprocessingDiff.  DTIPrep keeps the
+        order of the volumes and rotates the directions by the motion correction, so every QCed gradient is
+        matched to the next raw gradient of the same shell within `angleTolerance` degrees
+
+    >>> raw = numpy.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [0.6, 0.8, 0], [0, 0, 0], [0, 0.6, 0.8]])
+    >>> qced = raw[[0, 1, 2, 4, 6]] + [0, 0.02, 0]  # Rotated slightly
+    >>> diff = compareGradients(raw, 1000.0, qced, 1000.0)
+    >>> diff.removed, diff.unmatched, diff.baselines, diff.shells[0][:3]
+    ((3, 5), (), (2, 1), (1000.0, 5, 4))
+    >>> print diff.describe().splitlines()[0]
+    Removed by DTIPrep: 2 of 7 volume(s): 3, 5
+    """
+    rawShells, rawDirections = _shellsAndDirections(rawGradients, rawBValue, baselineB, shellTolerance)
+    qcedShells, qcedDirections = _shellsAndDirections(qcedGradients, qcedBValue, baselineB, shellTolerance)
+    # Whole table at once: a QCed gradient matches the raw gradients of its shell pointing the same way
+    cosines = numpy.abs(qcedDirections.dot(rawDirections.T))
+    matches = (qcedShells[:, numpy.newaxis] == rawShells) & ((cosines >= numpy.cos(numpy.radians(angleTolerance))) |
+                                                             (qcedShells == 0)[:, numpy.newaxis])
+    kept = numpy.zeros(len(rawShells), dtype=bool)
+    unmatched = []
+    start = 0
+    for index, row in enumerate(matches):
+        candidates = numpy.flatnonzero(row[start:])
+        if len(candidates):
+            start += candidates[0]
+            kept[start] = True
+            start += 1
+        else:
+            unmatched.append(index)
+    shells = []
+    for shell in numpy.unique(rawShells[rawShells > 0]):
+        inShell = rawShells == shell
+        remaining = qcedDirections[qcedShells == shell]
+        gap = 90.0
+        if len(remaining):
+            nearest = numpy.abs(rawDirections[inShell].dot(remaining.T)).max(axis=1)
+            gap = float(numpy.degrees(numpy.arccos(numpy.minimum(nearest, 1.0))).max())
+        shells.append((float(shell), int(inShell.sum()), int((qcedShells == shell).sum()), gap))
+    baselines = (int((rawShells == 0).sum()), int((qcedShells == 0).sum()))
+    return PreprocessingDiff(len(rawShells), len(qcedShells), tuple(int(index) for index in numpy.flatnonzero(~kept)),
+                             tuple(unmatched), baselines, tuple(shells))
@@ -8,7 +8,7 @@ try:
 except:
     pass
 
-from . import __slicer_module__, postgresDatabase
+from . import __slicer_module__, closePools, openQueue, QUEUE, DirectoryCache, SessionNodeRegistry, openQuickLookCache, GradientTableCache, compareGradients, QCED_SUFFIX, rawFileCandidates, sessionDirectory
 
 try:
     import ConfigParser as cParser
@@ -38,6 +38,10 @@ class DWIPreprocessingQALogic(object):
         self.currentSession = None
         self.currentValues = (None,) * len(self.images)
         self.sessionFiles = {}
+        self.directoryCache = DirectoryCache()
+        self.gradientTables = GradientTableCache()
+        self.sceneNodes = None  # SessionNodeRegistry of the nodes each session added to the scene
+        self.quickLooks = None  # QuickLookCache of the mean baseline and diffusion weighted volumes
         self.testing = test
         self.setup()
 
@@ -51,7 +55,7 @@ class DWIPreprocessingQALogic(object):
 
         >>> widget = widget('DWI')
         >>> logic = DWIPreprocessingQALogic(widget, True)
-        >>> logic.database.database == 'test' and logic.database.host == 'psych-db.psychiatry.uiowa.edu' and logic.database.password == 'test' and logic.database.login == 'user1' and logic.database.pguser == 'test'
+        >>> logic.database.backend.database == 'test' and logic.database.backend.host == 'psych-db.psychiatry.uiowa.edu' and logic.database.backend.password == 'test' and logic.database.login == 'user1' and logic.database.backend.user == 'test'
         True
         """
         # self.createColorTable()
@@ -65,15 +69,13 @@ class DWIPreprocessingQALogic(object):
         if not os.path.exists(configFile):
             raise IOError("File {0} not found!".format(configFile))
         config.read(configFile)
-        host = config.get('Postgres', 'Host')
-        port = config.getint('Postgres', 'Port')
-        database = config.get('Postgres', 'Database')
-        db_user = config.get('Postgres', 'User')
         # TODO: Use secure password handling (see RunSynchronization.py in phdxnat project)
-        password = config.get('Postgres', 'Password')
-        schema = config.get('Postgres', 'Schema')
-        self.database = postgresDatabase(host, port, db_user, database, schema, password,
-                                         self.user_id, self.batchSize)
+        self.database = openQueue(config, QUEUE, self.user_id, self.batchSize)
+        sessionWindow = 2  # Current and previous session
+        if config.has_option('Display', 'session_window'):
+            sessionWindow = config.getint('Display', 'session_window')
+        self.sceneNodes = SessionNodeRegistry(slicer.mrmlScene, sessionWindow)
+        self.quickLooks = openQuickLookCache(config)
 
     def createColorTable(self):
         """
@@ -127,8 +129,7 @@ class DWIPreprocessingQALogic(object):
         recordID = self.batchRows[self.count][0]
         values = (recordID,) + evaluations
         try:
-            self.database.writeReview(values)
-            self.database.unlockRecord('R', recordID)
+            self.database.submitReview(values)
         except:
             # TODO: Prompt user with popup
             print "Error writing to database! "
@@ -147,45 +148,89 @@ class DWIPreprocessingQALogic(object):
     def onGetBatchFilesClicked(self):
         """ """
         self.count = 0
-        self.batchRows = self.database.lockAndReadRecords()
+        # Sessions with missing files are marked 'M' in bulk until a complete one is claimed
+        row, self.sessionFiles = self.database.claimCompleteRecord(self.constructFilePaths)
+        self.batchRows = [row]
         self.maxCount = len(self.batchRows)
-        self.constructFilePaths()
         self.setCurrentSession()
         self.loadData()
 
     def setCurrentSession(self):
         self.currentSession = self.sessionFiles['session']
+        self.sceneNodes.activate(self.currentSession)
         self.widget.currentSession = self.currentSession
 
-    def constructFilePaths(self):
-        row = self.batchRows[self.count]
+    def constructFilePaths(self, row):
+        """ Return the session files of a claimed row, or None if the DTIPrep output is missing """
         sessionFiles = {}
-        # Due to a poor choice in our database creation, the 'location' column is the 6th, NOT the 2nd
-        baseDirectory = os.path.join(row[5], row[1], row[2], row[3], row[4])
+        baseDirectory = sessionDirectory(row)
         sessionFiles['session'] = row[4]
         sessionFiles['record_id'] = row[0]
         #outputDir = os.path.join(baseDirectory, 'DTIPrepOutput')
         outputDir = os.path.join(baseDirectory, '')
-        outputList = os.listdir(outputDir)
-        for item in outputList:
-            if item[-10:] == '_QCed.nrrd':  # This suffix comes from DTIPrep script...
-                sessionFiles['DWI'] = os.path.join(outputDir, item)
-                break
+        for item in self.directoryCache.matching(outputDir, QCED_SUFFIX):
+            sessionFiles['DWI'] = item
+            break
         if not 'DWI' in sessionFiles.keys():
-            raise IOError("File ending in _QCed.nrrd could not be found in directory %s" % outputDir)
-        self.sessionFiles = sessionFiles
-        # Verify that the files exist
-        for key in self.images:
-            if not os.path.exists(self.sessionFiles[key]):
-                print "File not found: %s\nSkipping session..." % self.sessionFiles[key]
-                self.database.unlockRecord('M', self.sessionFiles['record_id'])
-                self.onGetBatchFilesClicked()
-                # TODO: Generalize for a batch size > 1
-                # for count in range(self.maxCount - self.count):
-                #     print "This is the count: %d" % count
+            print "File ending in _QCed.nrrd could not be found in directory %s\nSkipping session..." % outputDir
+            return None
+        # The raw DWI is only compared with, so a session without one is still reviewed
+        sessionFiles['raw'] = self.directoryCache.find(rawFileCandidates(sessionFiles['DWI']))
+        return sessionFiles
+
+    def comparePreprocessing(self):
+        """ Return the description of the gradients DTIPrep removed from the raw DWI of the session, read from
+            the two headers only
+        """
+        if self.sessionFiles.get('raw') is None:
+            return 'Raw DWI not found next to %s' % os.path.basename(self.sessionFiles['DWI'])
+        try:
+            raw = self.gradientTables.table(self.sessionFiles['raw'])
+            qced = self.gradientTables.table(self.sessionFiles['DWI'])
+        except (IOError, OSError, ValueError) as error:
+            return 'Could not compare with the raw DWI: %s' % error
+        return compareGradients(raw.gradients, raw.bValue, qced.gradients, qced.bValue).describe()
 
     def loadData(self):
-        """ Load some default data for development and set up a viewing scenario for it.
+        """ Show the quick look volumes of the session if they were built (see QALib.quicklook), leaving the 4D DWI
+            to the "Load full DWI" button, otherwise load the 4D DWI right away
+        """
+        self.widget.displayPreprocessingDiff(self.comparePreprocessing())
+        quickLookNode = self.loadQuickLooks(self.sessionFiles['DWI'], '%s_dwi' % self.currentSession)
+        if quickLookNode is None:
+            self.loadDWI()
+            return
+        self.loadBackgroundNodeToMRMLScene(quickLookNode)
+        # Reading the 4D image blocks the main thread: it is only read when the reviewer asks for it, unless this
+        # session's image is still in the scene
+        dwiVolumeNode = slicer.util.getNode('%s_dwi' % self.currentSession)
+        self.widget.dwiWidget.setMRMLVolumeNode(dwiVolumeNode)
+        self.widget.loadDWIButton.setEnabled(dwiVolumeNode is None)
+
+    def loadQuickLooks(self, fileName, prefix):
+        """ Load the quick look volumes of `fileName` as `prefix`_mean_b0, ... and return the mean DWI node, or
+            None if they have not been built
+        """
+        if self.quickLooks is None:
+            return None
+        paths = self.quickLooks.lookup(fileName)
+        if paths is None:
+            return None
+        volumeLogic = slicer.modules.volumes.logic()
+        for name, path in paths.items():
+            nodeName = '%s_%s' % (prefix, name)
+            if slicer.util.getNode(nodeName) is None:
+                volumeLogic.AddArchetypeVolume(path, nodeName, 0)
+                volumeNode = slicer.util.getNode(nodeName)
+                if volumeNode is None:
+                    return None
+                volumeNode.CreateDefaultDisplayNodes()
+                self.sceneNodes.register(self.currentSession, volumeNode)
+                volumeNode.GetDisplayNode().AutoWindowLevelOn()
+        return slicer.util.getNode('%s_mean_dwi' % prefix)
+
+    def loadDWI(self):
+        """ Load the 4D DWI into the slice views and the DWI display widget
         """
         dataDialog = qt.QPushButton()
         dataDialog.setText('Loading file for session %s...' % self.currentSession)
@@ -199,10 +244,12 @@ class DWIPreprocessingQALogic(object):
                 raise IOError("Could not load session file for DWI! File: %s" % self.sessionFiles['DWI'])
             dwiVolumeNode = slicer.util.getNode(dwiNodeName)
             dwiVolumeNode.CreateDefaultDisplayNodes()
+            self.sceneNodes.register(self.currentSession, dwiVolumeNode)
             dwiVolumeNode.GetDisplayNode().AutoWindowLevelOn()
         dataDialog.close()
         self.loadBackgroundNodeToMRMLScene(dwiVolumeNode)
         self.widget.dwiWidget.setMRMLVolumeNode(dwiVolumeNode)
+        self.widget.loadDWIButton.setEnabled(False)
 
     def loadBackgroundNodeToMRMLScene(self, volumeNode):
         # Set up template scene
@@ -216,12 +263,15 @@ class DWIPreprocessingQALogic(object):
         applicationLogic.FitSliceToAll()
 
     def loadNewSession(self):
-        self.constructFilePaths()
+        self.sessionFiles = self.constructFilePaths(self.batchRows[self.count])
+        if self.sessionFiles is None:
+            raise IOError("Files for record %s are no longer available" % self.batchRows[self.count][0])
         self.setCurrentSession()
         self.loadData()
 
     def exit(self):
-        self.database.unlockRecord('U')
+        self.database.unlockRecords()
+        closePools()
 
 if __name__ == "__main__":
     import doctest
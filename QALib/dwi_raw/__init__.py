@@ -1,5 +1,9 @@
-from .. import __slicer_module__, pg8000, sql
+from .. import __slicer_module__, closePools, openQueue, AUTO_PREFIX, DirectoryCache, SessionNodeRegistry
 from helper import *
-from reader import getGradients as dwiReader
+from reader import getGradients as dwiReader, readGradients, readHeader
+from gradients import GradientMetrics, GradientTableCache, gradientMetrics
+from artifacts import ArtifactReport, detectArtifacts, reviewValues
+from voxels import DWIReader
+from summary import QuickLookCache, openQuickLookCache
 from logic import *
 
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+""" Automated answers to the DWI raw questions: slice dropout and venetian blind (interleave) artifacts found
+    from the mean intensity of every slice of every gradient volume, computed for the whole 4D array at once
+"""
+import collections
+
+import numpy
+
+
+class ArtifactReport(collections.namedtuple('ArtifactReport', ('dropouts', 'interleaved', 'badBaselines'))):
+    """ - `dropouts`: ((gradient, slice, ratio to the neighbouring slices), ...)
+        - `interleaved`: The gradients whose odd and even slices differ in intensity
+        - `badBaselines`: The gradients listed as baselines that are not brighter than the weighted volumes
+    """
+    __slots__ = ()
+
+    def describe(self):
+        """ A one line summary, written as the review comments """
+        findings = []
+        if self.dropouts:
+            gradients = sorted(set(gradient for gradient, index, ratio in self.dropouts))
+            findings.append('%d slice dropout(s) in gradient(s) %s' % (len(self.dropouts),
+                                                                       ', '.join(str(g) for g in gradients)))
+        if self.interleaved:
+            findings.append('interleave artifact in gradient(s) %s' % ', '.join(str(g) for g in self.interleaved))
+        if self.badBaselines:
+            findings.append('baseline(s) %s not brighter than the weighted volumes' %
+                            ', '.join(str(g) for g in self.badBaselines))
+        return '; '.join(findings) or 'no artifact found'
+
+
+def sliceMeans(data, minVoxels=100):
+    """ Return the (gradients, slices) mean intensities of `data`, indexed [k, j, i, gradient] as read by
+        volumes.readVolume(), over a foreground mask of the mean volume.  Slices with less than `minVoxels`
+        foreground voxels are NaN.  `data` can be a voxels.DWIReader, read slice by slice in two passes
+    """
+    if hasattr(data, 'slices'):
+        meanVolume = numpy.empty(data.shape[:3], dtype=numpy.float32)
+        for k, block in data.slices():
+            meanVolume[k] = block.mean(axis=-1)
+        mask = meanVolume > meanVolume.mean()
+        sums = numpy.empty((data.shape[-1], data.shape[0]))
+        for k, block in data.slices():
+            sums[:, k] = numpy.einsum('jin,ji->n', block, mask[k].astype(numpy.float32))
+    else:
+        meanVolume = data.mean(axis=-1)
+        mask = meanVolume > meanVolume.mean()
+        # One pass over the 4D array, accumulated in floating point
+        sums = numpy.einsum('kjin,kji->nk', data, mask.astype(numpy.float32))
+    counts = mask.sum(axis=(1, 2)).astype(numpy.float64)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        means = sums / counts
+    means[:, counts < minVoxels] = numpy.nan
+    return means
+
+
+def detectArtifacts(data, gradients, bValue, baselineB=50.0, shellTolerance=100.0, dropoutRatio=0.7,
+                    interleaveRatio=0.15, baselineContrast=1.2, minVoxels=100):
+    """ Find slice dropouts, interleaved volumes and baselines that are not baselines in a 4D DWI
+
+    Arguments:
+    - `data`: The voxels indexed [k, j, i, gradient], or a voxels.DWIReader
+    - `gradients`, `bValue`: The gradient table of the header, see reader.readGradients()
+    - `dropoutRatio`: A slice darker than this fraction of its neighbours, once normalized by the same slice of
+                      the other volumes of its shell, is a dropout
+    - `interleaveRatio`: The relative difference between the odd and even slices of an interleaved volume
+    - `baselineContrast`: How much brighter than the median weighted volume a baseline must be
+    ------------------------
+    >>> gradients = numpy.array([[0, 0, 0]] + [[1, 0, 0], [0, 1, 0], [0, 0, 1], [0.7, 0.7, 0]] * 2)
+    >>> data = numpy.zeros((8, 20, 20, 9), dtype=numpy.int16)
+    >>> data[:, 5:15, 5:15, :] = 400; data[:, 5:15, 5:15, 0] = 1000
+    >>> data[4, 5:15, 5:15, 3] = 100  # Dropout
+    >>> data[1::2, 5:15, 5:15, 6] = 250  # Venetian blind
+    >>> report = detectArtifacts(data, gradients, 1000.0, minVoxels=50)
+    >>> report.dropouts, report.interleaved, report.badBaselines
+    (((3, 4, 0.25),), (6,), ())
+    """
+    gradients = numpy.asarray(gradients, dtype=numpy.float64).reshape(-1, 3)
+    if data.ndim != 4 or data.shape[-1] != len(gradients):
+        raise ValueError("Expected %d gradient volumes, the image has shape %s" % (len(gradients), data.shape))
+    means = sliceMeans(data, minVoxels)
+    bValues = (bValue or 0.0) * (gradients ** 2).sum(axis=1)
+    groups = numpy.where(bValues > baselineB, numpy.round(bValues / shellTolerance) * shellTolerance, 0.0)
+    # Normalize every slice by the same slice of the other volumes of its shell, which removes the slice profile
+    normalized = numpy.empty_like(means)
+    for group in numpy.unique(groups):
+        inGroup = groups == group
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            normalized[inGroup] = means[inGroup] / numpy.nanmedian(means[inGroup], axis=0)
+    with numpy.errstate(invalid='ignore'):
+        # Medians, so that a single dropout does not make a volume look interleaved
+        even = numpy.nanmedian(normalized[:, 0::2], axis=1)
+        odd = numpy.nanmedian(normalized[:, 1::2], axis=1)
+        interleaved = numpy.abs(even - odd) / ((even + odd) / 2.0) > interleaveRatio
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        neighbours = normalized[:, 1:-1] / ((normalized[:, :-2] + normalized[:, 2:]) / 2.0)
+        # Every other slice of an interleaved volume is darker than its neighbours; it is reported once as such
+        gradientIndex, sliceIndex = numpy.nonzero((neighbours < dropoutRatio) & ~interleaved[:, numpy.newaxis])
+    dropouts = tuple((int(gradient), int(index) + 1, round(float(neighbours[gradient, index]), 2))
+                     for gradient, index in zip(gradientIndex, sliceIndex))
+    baselines = groups == 0
+    badBaselines = ()
+    if baselines.any() and not baselines.all():
+        volumeMeans = numpy.nanmean(means, axis=1)
+        weightedMedian = numpy.median(volumeMeans[~baselines])
+        badBaselines = tuple(int(gradient) for gradient in
+                             numpy.flatnonzero(baselines & (volumeMeans < baselineContrast * weightedMedian)))
+    return ArtifactReport(dropouts, tuple(int(gradient) for gradient in numpy.flatnonzero(interleaved)), badBaselines)
+
+
+def reviewValues(gradients, report, nearZero=0.1):
+    """ Return the answers to dwi_raw_1..4 and the comments, in the order of helper.REVIEW_COLUMNS
+
+    >>> reviewValues(numpy.zeros((3, 3)), ArtifactReport((), (), ()))
+    (True, False, True, False, 'all gradients are zero; no artifact found')
+    """
+    norms = numpy.sqrt((numpy.asarray(gradients, dtype=numpy.float64).reshape(-1, 3) ** 2).sum(axis=1))
+    allZero = bool((norms == 0).all())
+    closeToZero = not allZero and bool((norms < nearZero).all())
+    baselinesAreBaselines = not report.badBaselines
+    convertedProperly = not (allZero or closeToZero or report.badBaselines or report.dropouts or report.interleaved)
+    comments = report.describe()
+    if allZero:
+        comments = 'all gradients are zero; ' + comments
+    elif closeToZero:
+        comments = 'all gradients are shorter than %g; ' % nearZero + comments
+    return (allZero, closeToZero, baselinesAreBaselines, convertedProperly, comments)
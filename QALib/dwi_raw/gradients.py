@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+""" Gradient scheme checks of a DWI, computed on the whole (N, 3) gradient table at once """
+import collections
+import os
+import threading
+
+import numpy
+
+from reader import readHeader
+
+
+class GradientMetrics(collections.namedtuple('GradientMetrics', ('count', 'baselines', 'shells', 'duplicates',
+                                                                 'antipodal', 'normDeviation', 'minAngle',
+                                                                 'maxAngle', 'angleCV'))):
+    """ The numbers a reviewer needs to answer the gradient questions of dwi_raw_*.html:
+        - `shells`: ((b-value, gradient count), ...) of the diffusion weighted gradients
+        - `duplicates`/`antipodal`: pairs of directions of the same shell within the angle tolerance
+        - `normDeviation`: the largest distance of a gradient norm from the median norm of its shell
+        - `minAngle`/`maxAngle`/`angleCV`: the nearest neighbour angles (degrees, antipodally symmetric)
+          of the directions and their coefficient of variation, 0 for a perfectly uniform scheme
+    """
+    __slots__ = ()
+
+    def describe(self):
+        """ Lines for the module panel """
+        shells = ', '.join('b=%g x%d' % shell for shell in self.shells) or 'none'
+        return '\n'.join(('Gradients: %d, baselines: %d' % (self.count, self.baselines),
+                          'Shells: %s' % shells,
+                          'Duplicate directions: %d, antipodal pairs: %d' % (self.duplicates, self.antipodal),
+                          'Largest norm deviation: %.3f' % self.normDeviation,
+                          'Nearest neighbour angle: %.1f-%.1f deg (CV %.2f)' % (self.minAngle, self.maxAngle,
+                                                                                self.angleCV)))
+
+
+def gradientMetrics(gradients, bValue, baselineB=50.0, shellTolerance=100.0, angleTolerance=1.0):
+    """ Compute the GradientMetrics of an (N, 3) gradient table, with NRRD's convention that the effective
+        b-value of a gradient is `bValue` scaled by its squared norm
+
+    >>> gradients = numpy.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [-1, 0, 0], [0, 1, 0]])
+    >>> metrics = gradientMetrics(gradients, 1000.0)
+    >>> metrics.baselines, metrics.shells, metrics.duplicates, metrics.antipodal
+    (1, ((1000.0, 5),), 1, 1)
+    >>> print metrics.describe().splitlines()[-1]
+    Nearest neighbour angle: 0.0-90.0 deg (CV 2.00)
+    """
+    gradients = numpy.asarray(gradients, dtype=numpy.float64).reshape(-1, 3)
+    norms = numpy.sqrt((gradients ** 2).sum(axis=1))
+    bValues = (bValue or 0.0) * norms ** 2
+    weighted = bValues > baselineB
+    norms = norms[weighted]
+    shellOf = numpy.round(bValues[weighted] / shellTolerance) * shellTolerance
+    shellValues, shellCounts = numpy.unique(shellOf, return_counts=True)
+    shells = tuple((float(b), int(count)) for b, count in zip(shellValues, shellCounts))
+    normDeviation = 0.0
+    for b in shellValues:
+        inShell = norms[shellOf == b]
+        normDeviation = max(normDeviation, float(numpy.abs(inShell - numpy.median(inShell)).max()))
+    if len(norms) < 2:
+        return GradientMetrics(len(gradients), int((~weighted).sum()), shells, 0, 0, normDeviation, 0.0, 0.0, 0.0)
+    directions = gradients[weighted] / norms[:, numpy.newaxis]
+    cosines = directions.dot(directions.T)
+    threshold = numpy.cos(numpy.radians(angleTolerance))
+    # Pairs of the same shell, each counted once
+    pairs = numpy.triu(shellOf[:, numpy.newaxis] == shellOf, k=1)
+    duplicates = int(numpy.count_nonzero((cosines > threshold) & pairs))
+    antipodal = int(numpy.count_nonzero((cosines < -threshold) & pairs))
+    # A direction and its opposite measure the same diffusion
+    nearest = numpy.abs(cosines, out=cosines)
+    nearest.flat[::len(nearest) + 1] = -1.0
+    angles = numpy.degrees(numpy.arccos(numpy.minimum(nearest.max(axis=1), 1.0)))
+    mean = angles.mean()
+    angleCV = float(angles.std() / mean) if mean > 0 else 0.0
+    return GradientMetrics(len(gradients), int((~weighted).sum()), shells, duplicates, antipodal, normDeviation,
+                           float(angles.min()), float(angles.max()), angleCV)
+
+
+class GradientTable(collections.namedtuple('GradientTable', ('gradients', 'bValue', 'strings', 'metrics'))):
+    """ The parsed gradient table of a DWI file, its panel strings and its GradientMetrics """
+    __slots__ = ()
+
+
+class GradientTableCache(object):
+    """ GradientTables of DWI files, memoized on path and mtime so that a file is parsed and checked once """
+
+    def __init__(self, maxEntries=1024):
+        """
+        Arguments:
+        - `maxEntries`: The number of tables kept, least recently used are dropped first
+        ------------------------
+        >>> import tempfile
+        >>> fileName = os.path.join(tempfile.mkdtemp(), 'dwi.nhdr')
+        >>> with open(fileName, 'w') as fID:
+        ...   fID.write('NRRD0005\\nDWMRI_b-value:=1000\\nDWMRI_gradient_0000:=0 0 0\\nDWMRI_gradient_0001:=1 0 0\\n')
+        >>> cache = GradientTableCache()
+        >>> cache.table(fileName) is cache.table(fileName), cache.misses, cache.hits
+        (True, 1, 1)
+        """
+        self.maxEntries = maxEntries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # (path, mtime) -> GradientTable
+        self._lock = threading.Lock()
+
+    def table(self, fileName):
+        """ Return the GradientTable of `fileName` """
+        fileName = os.path.abspath(fileName)
+        key = (fileName, os.stat(fileName).st_mtime)
+        with self._lock:
+            table = self._entries.pop(key, None)
+            if table is not None:
+                self.hits += 1
+                self._entries[key] = table
+                return table
+        self.misses += 1
+        header = readHeader(fileName)
+        gradients, bValue = header.gradients(), header.bValue()
+        table = GradientTable(gradients, bValue, header.gradientStrings(), gradientMetrics(gradients, bValue))
+        with self._lock:
+            self._entries[key] = table
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+        return table
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
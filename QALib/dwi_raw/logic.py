@@ -8,7 +8,7 @@ try:
 except:
     pass
 
-from . import __slicer_module__, postgresDatabase, dwiReader
+from . import __slicer_module__, closePools, openQueue, QUEUE, AUTO_PREFIX, DirectoryCache, SessionNodeRegistry, openQuickLookCache, GradientTableCache, sessionFileName, sessionFilePath
 
 try:
     import ConfigParser as cParser
@@ -34,7 +34,12 @@ class DWIRawQALogic(object):
         self.currentSession = None
         self.currentFile = None
         self.currentValues = (None,)*len(self.questions)
+        self.currentReviewValues = {}
         self.sessionFile = {}
+        self.directoryCache = DirectoryCache()
+        self.gradientTables = GradientTableCache()
+        self.sceneNodes = None  # SessionNodeRegistry of the nodes each session added to the scene
+        self.quickLooks = None  # QuickLookCache of the mean baseline and diffusion weighted volumes
         self.testing = test
         self.setup()
 
@@ -48,7 +53,7 @@ class DWIRawQALogic(object):
 
         >>> widget = widget('DWI')
         >>> logic = DWIPreprocessingQALogic(widget, True)
-        >>> logic.database.database == 'test' and logic.database.host == 'psych-db.psychiatry.uiowa.edu' and logic.database.password == 'test' and logic.database.login == 'user1' and logic.database.pguser == 'test'
+        >>> logic.database.backend.database == 'test' and logic.database.backend.host == 'psych-db.psychiatry.uiowa.edu' and logic.database.backend.password == 'test' and logic.database.login == 'user1' and logic.database.backend.user == 'test'
         True
         """
         config = cParser.SafeConfigParser()
@@ -60,13 +65,13 @@ class DWIRawQALogic(object):
         if not os.path.exists(configFile):
             raise IOError("File {0} not found!".format(configFile))
         config.read(configFile)
-        host = config.get('Postgres', 'Host')
-        port = config.getint('Postgres', 'Port')
-        database = config.get('Postgres', 'Database')
-        db_user = config.get('Postgres', 'User')
-        password = config.get('Postgres', 'Password') ### TODO: Use secure password handling (see RunSynchronization.py in phdxnat project)
-        self.database = postgresDatabase(host, port, db_user, database, password,
-                                         self.user_id, self.batchSize)
+        ### TODO: Use secure password handling (see RunSynchronization.py in phdxnat project)
+        self.database = openQueue(config, QUEUE, self.user_id, self.batchSize)
+        sessionWindow = 2  # Current and previous session
+        if config.has_option('Display', 'session_window'):
+            sessionWindow = config.getint('Display', 'session_window')
+        self.sceneNodes = SessionNodeRegistry(slicer.mrmlScene, sessionWindow)
+        self.quickLooks = openQuickLookCache(config)
 
     def selectRegion(self, buttonName):
         """ Load the raw DWI image
@@ -89,8 +94,7 @@ class DWIRawQALogic(object):
         recordID = self.batchRows[self.count][0]
         values = (recordID,) + evaluations
         try:
-            self.database.writeReview(values)
-            self.database.unlockRecord('R', recordID)
+            self.database.submitReview(values)
         except:
             # TODO: Prompt user with popup
             print "Error writing to database!"
@@ -99,40 +103,87 @@ class DWIRawQALogic(object):
     def onGetBatchFilesClicked(self):
         """ """
         self.count = 0
-        self.batchRows = self.database.lockAndReadRecords()
+        # Sessions with missing files are marked 'M' in bulk until a complete one is claimed
+        row, self.sessionFile = self.database.claimCompleteRecord(self.constructFilePaths)
+        self.batchRows = [row]
         self.maxCount = len(self.batchRows)
-        self.constructFilePaths()
         self.setCurrentSession()
         self.loadData()
-        gradientList = dwiReader(self.sessionFile['filePath'])
-        self.widget.displayGradients(gradientList)
+        gradientTable = self.gradientTables.table(self.sessionFile['filePath'])
+        self.widget.displayGradients(gradientTable.strings, gradientTable.metrics)
+        self.currentReviewValues = self.getAutomatedReviewValues(row)
+        self.widget.setRadioWidgets(self.currentReviewValues)
+
+    def getAutomatedReviewValues(self, row):
+        """ Return a {question: value} dictionary of the automated review joined to the row (see QALib.dwirater),
+            plus its 'comments', empty if there is none
+        """
+        if row.get(AUTO_PREFIX + 'review_id') is None:
+            return {}
+        columns = self.database.reviewColumns
+        values = dict((question, row[AUTO_PREFIX + column]) for question, column in zip(self.questions, columns))
+        values['comments'] = row[AUTO_PREFIX + columns[-1]]
+        return values
 
     def setCurrentSession(self):
         self.currentSession = self.sessionFile['session']
+        self.sceneNodes.activate(self.currentSession)
+        self.currentFile = self.sessionFile['scan']
         self.widget.currentSession = self.currentSession
 
-    def constructFilePaths(self):
-        row = self.batchRows[self.count]
-        self.sessionFile = {}
-        baseDirectory = os.path.join(row[1], row[2], row[3], row[4], row[5])
-        self.currentFile = row[6]
-        fileName = '%s_%s_%s.nrrd' % (row[3], row[4], self.currentFile)
-        self.sessionFile['file'] = fileName
-        self.sessionFile['filePath'] = os.path.join(baseDirectory, fileName)
-        self.sessionFile['session'] = row[4]
-        self.sessionFile['record_id'] = row[0]
+    def constructFilePaths(self, row):
+        """ Return the session file of a claimed row, or None if the NRRD file is missing """
+        sessionFile = {}
+        sessionFile['file'] = sessionFileName(row)
+        sessionFile['filePath'] = sessionFilePath(row)
+        sessionFile['scan'] = row[6]
+        sessionFile['session'] = row[4]
+        sessionFile['record_id'] = row[0]
         # Verify that the files exist
-        if not os.path.exists(self.sessionFile['filePath']):
-            print "File not found: %s\nSkipping session..." % self.sessionFile['filePath']
-            # raise IOError("File not found!\nFile: %s" % self.sessionFile[key])
-            self.database.unlockRecord('M', self.sessionFile['record_id'])
-            self.onGetBatchFilesClicked()
-            # TODO: Generalize for a batch size > 1
-            # for count in range(self.maxCount - self.count):
-            #     print "This is the count: %d" % count
+        if not self.directoryCache.exists(sessionFile['filePath']):
+            print "File not found: %s\nSkipping session..." % sessionFile['filePath']
+            return None
+        return sessionFile
 
     def loadData(self):
-        """ Load some default data for development and set up a viewing scenario for it.
+        """ Show the quick look volumes of the session if they were built (see QALib.quicklook), leaving the 4D DWI
+            to the "Load full DWI" button, otherwise load the 4D DWI right away
+        """
+        quickLookNode = self.loadQuickLooks(self.sessionFile['filePath'], '%s_%s' % (self.currentSession, self.currentFile))
+        if quickLookNode is None:
+            self.loadDWI()
+            return
+        self.loadBackgroundNodeToMRMLScene(quickLookNode)
+        # Reading the 4D image blocks the main thread: it is only read when the reviewer asks for it, unless this
+        # session's image is still in the scene
+        dwiVolumeNode = slicer.util.getNode('%s_%s' % (self.currentSession, self.currentFile))
+        self.widget.dwiWidget.setMRMLVolumeNode(dwiVolumeNode)
+        self.widget.loadDWIButton.setEnabled(dwiVolumeNode is None)
+
+    def loadQuickLooks(self, fileName, prefix):
+        """ Load the quick look volumes of `fileName` as `prefix`_mean_b0, ... and return the mean DWI node, or
+            None if they have not been built
+        """
+        if self.quickLooks is None:
+            return None
+        paths = self.quickLooks.lookup(fileName)
+        if paths is None:
+            return None
+        volumeLogic = slicer.modules.volumes.logic()
+        for name, path in paths.items():
+            nodeName = '%s_%s' % (prefix, name)
+            if slicer.util.getNode(nodeName) is None:
+                volumeLogic.AddArchetypeVolume(path, nodeName, 0)
+                volumeNode = slicer.util.getNode(nodeName)
+                if volumeNode is None:
+                    return None
+                volumeNode.CreateDefaultDisplayNodes()
+                self.sceneNodes.register(self.currentSession, volumeNode)
+                volumeNode.GetDisplayNode().AutoWindowLevelOn()
+        return slicer.util.getNode('%s_mean_dwi' % prefix)
+
+    def loadDWI(self):
+        """ Load the 4D DWI into the slice views and the DWI display widget
         """
         dataDialog = qt.QPushButton();
         dataDialog.setText('Loading file for session %s...' % self.currentSession);
@@ -146,10 +197,12 @@ class DWIRawQALogic(object):
                 raise IOError("Could not load session file for DWI! File: %s" % self.sessionFile['DWI'])
             dwiVolumeNode = slicer.util.getNode(dwiNodeName)
             dwiVolumeNode.CreateDefaultDisplayNodes()
+            self.sceneNodes.register(self.currentSession, dwiVolumeNode)
             dwiVolumeNode.GetDisplayNode().AutoWindowLevelOn()
         dataDialog.close()
         self.loadBackgroundNodeToMRMLScene(dwiVolumeNode)
         self.widget.dwiWidget.setMRMLVolumeNode(dwiVolumeNode)
+        self.widget.loadDWIButton.setEnabled(False)
 
     def loadBackgroundNodeToMRMLScene(self, volumeNode):
         # Set up template scene
@@ -219,12 +272,15 @@ class DWIRawQALogic(object):
 
 
     def loadNewSession(self):
-        self.constructFilePaths()
+        self.sessionFile = self.constructFilePaths(self.batchRows[self.count])
+        if self.sessionFile is None:
+            raise IOError("File for record %s is no longer available" % self.batchRows[self.count][0])
         self.setCurrentSession()
         self.loadData()
 
     def exit(self):
-        self.database.unlockRecord('U')
+        self.database.unlockRecords()
+        closePools()
 
 if __name__ == "__main__":
     import doctest
@@ -1,5 +1,111 @@
+#!/usr/bin/env python
+""" Read the gradient table of a DWI NRRD from its header alone.  The header of an attached .nrrd ends at the
+    first blank line and the (possibly gzipped) voxels that follow are never read; a detached .nhdr is all header
+"""
+import collections
 import re
 
+import numpy
+
+GRADIENT_PREFIX = 'DWMRI_gradient_'
+NEX_PREFIX = 'DWMRI_NEX_'
+BVALUE_KEY = 'DWMRI_b-value'
+
+
+class NrrdHeader(collections.namedtuple('NrrdHeader', ('fields', 'keyValues', 'text'))):
+    """ The fields ({lower case name: value}), the ordered key/value pairs and the raw text of a NRRD header """
+    __slots__ = ()
+
+    def sizes(self):
+        """ Return the sizes of the axes as a tuple of ints """
+        return tuple(int(size) for size in self.fields.get('sizes', '').split())
+
+    def spacing(self):
+        """ Return the voxel spacing of the space axes, from 'space directions' or else 'spacings' """
+        directions = self.fields.get('space directions')
+        if directions is not None:
+            vectors = re.findall(r'\(([^)]*)\)', directions)
+            return tuple(float(numpy.sqrt(sum(float(component) ** 2 for component in vector.split(','))))
+                         for vector in vectors)
+        return tuple(float(spacing) for spacing in self.fields.get('spacings', '').split()
+                     if spacing.lower() != 'nan')
+
+    def gradients(self):
+        """ Return the gradient directions as an (N, 3) array, with the DWMRI_NEX_ repetitions expanded """
+        vectors = []
+        for key, value in self.keyValues.items():
+            if key.startswith(GRADIENT_PREFIX):
+                vector = [float(component) for component in value.split()]
+                repeat = int(self.keyValues.get(NEX_PREFIX + key[len(GRADIENT_PREFIX):], 1))
+                vectors.extend([vector] * repeat)
+        return numpy.array(vectors, dtype=numpy.float64).reshape(-1, 3)
+
+    def bValue(self):
+        """ Return the nominal b-value, or None if the header has none """
+        value = self.keyValues.get(BVALUE_KEY)
+        if value is None:
+            return None
+        return float(value)
+
+    def gradientStrings(self):
+        """ The gradients as the truncated 'NNNN:=x y z' strings shown in the module panel """
+        gradientStringList = []
+        for key, value in self.keyValues.items():
+            if key.startswith(GRADIENT_PREFIX):
+                strip_version = key[len(GRADIENT_PREFIX):] + ':=' + value
+                clean_version = re.sub(r' *(?P<truncstring>[-]*0\.[0-9][0-9])[0-9]*',
+                                       '\g<truncstring> ',
+                                       strip_version)
+                gradientStringList.append(clean_version.strip(' \n'))
+        return gradientStringList
+
+
+def readHeader(fileName):
+    """ Read the header of a .nrrd or .nhdr file, stopping at the blank line that ends it
+
+    >>> import os, tempfile
+    >>> fileName = os.path.join(tempfile.mkdtemp(), 'dwi.nrrd')
+    >>> with open(fileName, 'wb') as fID:
+    ...   fID.write('NRRD0005\\ntype: short\\nsizes: 2 2 1 3\\nencoding: gzip\\nDWMRI_b-value:=1000\\n'
+    ...             'DWMRI_gradient_0000:=0 0 0\\nDWMRI_gradient_0001:=0.7071067 0.7071067 0\\n'
+    ...             'DWMRI_gradient_0002:=0 0 -1\\n\\n\\x1f\\x8b\\x08\\n\\nDWMRI_gradient_0003:=1 0 0\\n')
+    >>> header = readHeader(fileName)
+    >>> header.fields['encoding'], header.bValue(), header.gradients().shape, header.sizes()
+    ('gzip', 1000.0, (3, 3), (2, 2, 1, 3))
+    >>> header.gradientStrings()
+    ['0000:=0 0 0', '0001:=0.70 0.70  0', '0002:=0 0 -1']
+    """
+    fields = {}
+    keyValues = collections.OrderedDict()
+    lines = []
+    with open(fileName, 'rb') as fID:
+        magic = fID.readline()
+        if not magic.startswith('NRRD'):
+            raise IOError("%s is not a NRRD file" % fileName)
+        lines.append(magic)
+        while True:
+            line = fID.readline()
+            lines.append(line)
+            line = line.rstrip('\r\n')
+            if not line:
+                break  # End of the header, or of a detached header file
+            if line.startswith('#'):
+                continue
+            if ':=' in line:
+                key, value = line.split(':=', 1)
+                keyValues[key] = value
+            elif ': ' in line:
+                field, value = line.split(': ', 1)
+                fields[field.lower()] = value.strip()
+    return NrrdHeader(fields, keyValues, ''.join(lines))
+
+
+def readGradients(dwiFileName):
+    """ Return the (N, 3) gradient directions and the b-value of a DWI NRRD """
+    header = readHeader(dwiFileName)
+    return header.gradients(), header.bValue()
+
+
 def getGradients(dwiFileName):
     """
     >>> dwiFileName = '/paulsen/MRx/PHD_024/0132/43991/ANONRAW/0132_43991_DWI-31_6.nrrd'
@@ -37,20 +143,7 @@ def getGradients(dwiFileName):
     0029:=-0.85 0.17 -0.48
     0030:=-0.97 0.17 -0.09
     """
-    fID = open(dwiFileName)
-    gradientStringList = []
-    try:
-        for line in fID:
-            if "DWMRI_gradient_" in line:
-                strip_version = line.replace("DWMRI_gradient_", "")
-                clean_version = re.sub(r' *(?P<truncstring>[-]*0\.[0-9][0-9])[0-9]*',
-                                       '\g<truncstring> ',
-                                       strip_version)
-                clean_version = clean_version.strip(' \n')
-                gradientStringList.append(clean_version)
-    finally:
-        fID.close
-    return gradientStringList
+    return readHeader(dwiFileName).gradientStrings()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+""" Quick look volumes of a DWI: the mean baseline, the mean diffusion weighted volume and the maximum over the
+    diffusion weighted volumes, computed in one pass over the slices and stored as small raw NRRD files that
+    Slicer loads in well under a second, long before the 4D image
+"""
+import collections
+import hashlib
+import logging
+import os
+import threading
+
+import numpy
+
+from voxels import DWIReader
+
+_logger = logging.getLogger(__name__)
+
+QUICK_LOOKS = ('mean_b0', 'mean_dwi', 'max_dwi')
+
+
+def quickLookVolumes(reader, baselineB=50.0):
+    """ Return {name: volume indexed [k, j, i]} of the QUICK_LOOKS of a DWIReader, reading each slice once
+
+    >>> class Reader(object):
+    ...   shape = (2, 1, 2, 3)
+    ...   class header(object):
+    ...     @staticmethod
+    ...     def gradients(): return numpy.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+    ...     @staticmethod
+    ...     def bValue(): return 1000.0
+    ...   def slices(self):
+    ...     for k in range(2): yield k, numpy.array([[[900, 300, 500], [800, 200, 400]]]) * (k + 1)
+    >>> volumes = quickLookVolumes(Reader())
+    >>> volumes['mean_b0'][1].tolist(), volumes['mean_dwi'][0].tolist(), volumes['max_dwi'][0].tolist()
+    ([[1800.0, 1600.0]], [[400.0, 300.0]], [[500.0, 400.0]])
+    """
+    gradients = numpy.asarray(reader.header.gradients(), dtype=numpy.float64).reshape(-1, 3)
+    weighted = (reader.header.bValue() or 0.0) * (gradients ** 2).sum(axis=1) > baselineB
+    if len(weighted) != reader.shape[-1]:
+        raise ValueError("Expected %d gradient volumes, the image has %d" % (len(weighted), reader.shape[-1]))
+    volumes = collections.OrderedDict((name, numpy.zeros(reader.shape[:3], dtype=numpy.float32))
+                                      for name in QUICK_LOOKS)
+    baselines = numpy.flatnonzero(~weighted)
+    weighted = numpy.flatnonzero(weighted)
+    for k, block in reader.slices():
+        if len(baselines):
+            volumes['mean_b0'][k] = block[..., baselines].mean(axis=-1)
+        if len(weighted):
+            diffusion = block[..., weighted]
+            volumes['mean_dwi'][k] = diffusion.mean(axis=-1)
+            volumes['max_dwi'][k] = diffusion.max(axis=-1)
+    return volumes
+
+
+def writeNrrd(fileName, volume, fields):
+    """ Write a volume indexed [k, j, i] as a raw float NRRD file with the geometry `fields` of
+        DWIReader.spatialFields(), through a temporary file so readers never see a partial file
+    """
+    lines = ['NRRD0004', 'type: float', 'dimension: 3']
+    if 'space' in fields:
+        lines.append('space: %s' % fields['space'])
+    lines.append('sizes: %s' % ' '.join(str(size) for size in reversed(volume.shape)))
+    for name in ('space directions', 'spacings', 'kinds', 'space units'):
+        if name in fields:
+            lines.append('%s: %s' % (name, fields[name]))
+    lines.extend(['endian: little', 'encoding: raw'])
+    if 'space origin' in fields:
+        lines.append('space origin: %s' % fields['space origin'])
+    temporary = '%s.tmp%d' % (fileName, threading.current_thread().ident)
+    with open(temporary, 'wb') as fID:
+        fID.write('\n'.join(lines) + '\n\n')
+        fID.write(numpy.ascontiguousarray(volume, dtype='<f4').tostring())
+    os.rename(temporary, fileName)
+
+
+class QuickLookCache(object):
+    """ The quick look volumes of DWI files, keyed by source path, size and mtime.  Point a batch run
+        (python -m QALib.quicklook) and the review modules at the same directory to have them ready in advance
+    """
+
+    def __init__(self, directory):
+        """
+        Arguments:
+        - `directory`: The cache directory, created if needed
+        ------------------------
+        >>> import tempfile
+        >>> cache = QuickLookCache(tempfile.mkdtemp())
+        >>> fileName = os.path.join(cache.directory, 'dwi.nrrd')
+        >>> with open(fileName, 'wb') as fID:
+        ...   fID.write('NRRD0005\\ntype: uchar\\nsizes: 2 2 1 2\\nkinds: list space space space\\nencoding: raw\\n'
+        ...             'DWMRI_b-value:=1000\\nDWMRI_gradient_0000:=0 0 0\\nDWMRI_gradient_0001:=1 0 0\\n\\n'
+        ...             '\\x08\\x02\\x08\\x02\\x08\\x02\\x08\\x02')
+        >>> cache.lookup(fileName) is None and sorted(cache.build(fileName)) == sorted(QUICK_LOOKS)
+        True
+        >>> open(cache.lookup(fileName)['mean_b0']).read().endswith(numpy.float32(8).tostring())
+        True
+        """
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _key(self, fileName):
+        fileName = os.path.abspath(fileName)
+        stat = os.stat(fileName)
+        return hashlib.sha1('{0}|{1}|{2!r}'.format(fileName, stat.st_size, stat.st_mtime)).hexdigest()
+
+    def _paths(self, key):
+        return collections.OrderedDict((name, os.path.join(self.directory, '%s_%s.nrrd' % (key, name)))
+                                       for name in QUICK_LOOKS)
+
+    def lookup(self, fileName):
+        """ Return {name: quick look file} of `fileName`, or None if they have not been built """
+        paths = self._paths(self._key(fileName))
+        if all(os.path.exists(path) for path in paths.values()):
+            self.hits += 1
+            return paths
+        self.misses += 1
+        return None
+
+    def build(self, fileName, maxBytes=256 * 1024 ** 2):
+        """ Compute and store the quick look volumes of `fileName`, return {name: quick look file} """
+        paths = self._paths(self._key(fileName))
+        reader = DWIReader(fileName, maxBytes=maxBytes)
+        fields = reader.spatialFields()
+        for name, volume in quickLookVolumes(reader).items():
+            writeNrrd(paths[name], volume, fields)
+        return paths
+
+    def describe(self):
+        return 'quick looks: %d hit(s), %d miss(es)' % (self.hits, self.misses)
+
+
+def openQuickLookCache(config):
+    """ Return the QuickLookCache set in the [Cache] section of a configuration (quicklook = true (default) or
+        false, quicklook_directory = default $TMPDIR/SlicerQA_quicklook), or None if it is disabled
+    """
+    enabled = True
+    directory = os.path.join(os.environ.get('TMPDIR', '/tmp'), 'SlicerQA_quicklook')
+    if config.has_section('Cache'):
+        if config.has_option('Cache', 'quicklook'):
+            enabled = config.getboolean('Cache', 'quicklook')
+        if config.has_option('Cache', 'quicklook_directory'):
+            directory = config.get('Cache', 'quicklook_directory')
+    if not enabled:
+        return None
+    try:
+        return QuickLookCache(directory)
+    except OSError as error:
+        _logger.warning("Quick looks are disabled, %s is not usable: %s", directory, error)
+        return None
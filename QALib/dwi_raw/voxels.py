@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+""" Read the voxels of a 4D DWI NRRD one gradient volume or one slice at a time, so that statistics over
+    archives much larger than memory are computed with a fixed footprint.  Raw data is memory-mapped and gzip
+    data is decompressed in chunks as it streams by; the full 4D image is never materialized
+"""
+import os
+import re
+import zlib
+
+import numpy
+
+from reader import readHeader
+
+# NRRD type names and their numpy equivalent
+DTYPES = {}
+for _names, _dtype in ((('signed char', 'int8', 'int8_t'), 'i1'),
+                       (('uchar', 'unsigned char', 'uint8', 'uint8_t'), 'u1'),
+                       (('short', 'short int', 'signed short', 'signed short int', 'int16', 'int16_t'), 'i2'),
+                       (('ushort', 'unsigned short', 'unsigned short int', 'uint16', 'uint16_t'), 'u2'),
+                       (('int', 'signed int', 'int32', 'int32_t'), 'i4'),
+                       (('uint', 'unsigned int', 'uint32', 'uint32_t'), 'u4'),
+                       (('longlong', 'long long', 'long long int', 'signed long long', 'signed long long int',
+                         'int64', 'int64_t'), 'i8'),
+                       (('ulonglong', 'unsigned long long', 'unsigned long long int', 'uint64', 'uint64_t'), 'u8'),
+                       (('float',), 'f4'),
+                       (('double',), 'f8')):
+    for _name in _names:
+        DTYPES[_name] = _dtype
+
+# Kinds of the image axes, as opposed to the gradient axis
+SPATIAL_KINDS = ('domain', 'space', 'time')
+
+
+class DWIReader(object):
+    """ The voxels of a DWI NRRD (.nrrd, or .nhdr with a detached data file) in the [k, j, i, gradient] layout
+        of volumes.readVolume().  volumes() and slices() iterate without loading the whole image: they are
+        views of a memory map for raw data, and read from a single pass of the decompressed stream for gzip data
+        stored in the same order.  Otherwise the stream is read once per batch of `maxBytes`
+    """
+
+    def __init__(self, fileName, maxBytes=256 * 1024 ** 2, chunkBytes=1024 ** 2):
+        """
+        Arguments:
+        - `fileName`: The .nrrd or .nhdr file
+        - `maxBytes`: The memory gathered for the volumes (or slices) that are spread over the gzip stream
+        - `chunkBytes`: The compressed bytes read at once
+        ------------------------
+        >>> import gzip, tempfile
+        >>> data = numpy.arange(2 * 3 * 4 * 5, dtype=numpy.int16).reshape(2, 3, 4, 5)  # [k, j, i, gradient]
+        >>> directory = tempfile.mkdtemp()
+        >>> raw = os.path.join(directory, 'raw.nrrd')
+        >>> with open(raw, 'wb') as fID:
+        ...   fID.write('NRRD0005\\ntype: short\\ndimension: 4\\nsizes: 5 4 3 2\\nkinds: list space space space\\n'
+        ...             'endian: little\\nencoding: raw\\n\\n' + data.astype('<i2').tostring())
+        >>> reader = DWIReader(raw)
+        >>> reader.shape, [(index, volume.shape) for index, volume in reader.volumes()][-1]
+        ((2, 3, 4, 5), (4, (2, 3, 4)))
+        >>> detached = os.path.join(directory, 'gzip.nhdr')
+        >>> with open(detached, 'w') as fID:
+        ...   fID.write('NRRD0005\\ntype: short\\nsizes: 4 3 2 5\\nkinds: space space space list\\n'
+        ...             'endian: little\\nencoding: gzip\\ndata file: gzip.raw.gz\\n')
+        >>> stream = gzip.open(os.path.join(directory, 'gzip.raw.gz'), 'wb')
+        >>> written = stream.write(numpy.moveaxis(data, -1, 0).astype('<i2').tostring()); stream.close()
+        >>> reader = DWIReader(detached, maxBytes=2 * 2 * 3 * 4 * 2)
+        >>> all((volume == data[..., index]).all() for index, volume in reader.volumes())  # Three passes
+        True
+        >>> all((block == data[k]).all() for k, block in reader.slices())  # One pass
+        True
+        """
+        self.fileName = fileName
+        self.maxBytes = maxBytes
+        self.chunkBytes = chunkBytes
+        self.header = readHeader(fileName)
+        fields = self.header.fields
+        sizes = self.header.sizes()
+        if len(sizes) != 4:
+            raise ValueError("%s is not a 4D image" % fileName)
+        if fields.get('type') not in DTYPES:
+            raise ValueError("Unsupported NRRD type %r in %s" % (fields.get('type'), fileName))
+        self.dtype = numpy.dtype(DTYPES[fields['type']])
+        if fields.get('endian', 'little') == 'big':
+            self.dtype = self.dtype.newbyteorder('>')
+        else:
+            self.dtype = self.dtype.newbyteorder('<')
+        self.encoding = {'gz': 'gzip'}.get(fields.get('encoding'), fields.get('encoding'))
+        if self.encoding not in ('raw', 'gzip'):
+            raise ValueError("Unsupported NRRD encoding %r in %s" % (self.encoding, fileName))
+        # NRRD lists the fastest axis first, numpy the slowest
+        self._fileShape = tuple(reversed(sizes))
+        self._gradientAxis = 3 - self._findGradientAxis(sizes, fields.get('kinds', '').split())
+        spatial = tuple(size for axis, size in enumerate(self._fileShape) if axis != self._gradientAxis)
+        self.shape = spatial + (self._fileShape[self._gradientAxis],)
+        self.ndim = 4
+        self._dataFile, self._offset = self._locateData(fields)
+
+    def _findGradientAxis(self, sizes, kinds):
+        """ Return the NRRD axis of the gradients: the non spatial kind, else the one sized like the gradient table """
+        if len(kinds) == len(sizes):
+            for axis, kind in enumerate(kinds):
+                if kind.lower() not in SPATIAL_KINDS:
+                    return axis
+        count = len(self.header.gradients())
+        for axis, size in enumerate(sizes):
+            if size == count:
+                return axis
+        return 0
+
+    def _locateData(self, fields):
+        """ Return the file holding the data and the offset of its first byte """
+        dataFile = fields.get('data file', fields.get('datafile'))
+        if dataFile is None:
+            dataFile, offset = self.fileName, len(self.header.text)
+        else:
+            if dataFile.startswith('LIST') or len(dataFile.split()) > 1:
+                raise ValueError("Multiple data files are not supported: %s" % self.fileName)
+            if not os.path.isabs(dataFile):
+                dataFile = os.path.join(os.path.dirname(os.path.abspath(self.fileName)), dataFile)
+            offset = 0
+        lineSkip = int(fields.get('line skip', fields.get('lineskip', 0)))
+        byteSkip = int(fields.get('byte skip', fields.get('byteskip', 0)))
+        if lineSkip:
+            with open(dataFile, 'rb') as fID:
+                fID.seek(offset)
+                for line in range(lineSkip):
+                    fID.readline()
+                offset = fID.tell()
+        if byteSkip == -1 and self.encoding == 'raw':
+            offset = os.path.getsize(dataFile) - self.nbytes
+        elif byteSkip and self.encoding != 'raw':
+            raise ValueError("A byte skip of compressed data is not supported: %s" % self.fileName)
+        elif byteSkip > 0:
+            offset += byteSkip
+        return dataFile, offset
+
+    def spatialFields(self):
+        """ Return the NRRD fields giving the geometry of one volume of the image, i.e. without the gradient axis """
+        gradientAxis = 3 - self._gradientAxis
+        fields = {'kinds': 'domain domain domain'}
+        for name in ('space', 'space origin', 'space units'):
+            if name in self.header.fields:
+                fields[name] = self.header.fields[name]
+        for name, pattern in (('space directions', r'\([^)]*\)|none'), ('spacings', r'\S+')):
+            if name in self.header.fields:
+                values = re.findall(pattern, self.header.fields[name])
+                if len(values) == 4:
+                    fields[name] = ' '.join(values[:gradientAxis] + values[gradientAxis + 1:])
+        return fields
+
+    @property
+    def nbytes(self):
+        return int(numpy.prod(self.shape)) * self.dtype.itemsize
+
+    def _memmap(self):
+        """ The raw data mapped in file order """
+        return numpy.memmap(self._dataFile, dtype=self.dtype, mode='r', offset=self._offset, shape=self._fileShape)
+
+    def _blocks(self):
+        """ Yield the data along the slowest axis of the file, decompressing one block at a time """
+        blockShape = self._fileShape[1:]
+        blockBytes = int(numpy.prod(blockShape)) * self.dtype.itemsize
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip header and trailer
+        buffered, size, count = [], 0, 0
+        with open(self._dataFile, 'rb') as fID:
+            fID.seek(self._offset)
+            while count < self._fileShape[0]:
+                compressed = fID.read(self.chunkBytes)
+                if compressed:
+                    data = decompressor.decompress(compressed)
+                else:
+                    data = decompressor.flush()
+                buffered.append(data)
+                size += len(data)
+                while size >= blockBytes and count < self._fileShape[0]:
+                    joined = ''.join(buffered)
+                    yield numpy.frombuffer(joined, dtype=self.dtype, count=blockBytes // self.dtype.itemsize).reshape(
+                        blockShape)
+                    buffered, size, count = [joined[blockBytes:]], size - blockBytes, count + 1
+                if not compressed:
+                    break
+        if count < self._fileShape[0]:
+            raise IOError("%s ends after %d of %d blocks" % (self._dataFile, count, self._fileShape[0]))
+
+    def _batches(self, count, itemBytes):
+        """ Split `count` items of `itemBytes` bytes into slices of at most maxBytes """
+        size = max(1, self.maxBytes // itemBytes)
+        return [slice(start, min(start + size, count)) for start in range(0, count, size)]
+
+    def volumes(self):
+        """ Yield (gradient, volume indexed [k, j, i]) for every gradient, in order """
+        count = self.shape[-1]
+        if self.encoding == 'raw':
+            array = numpy.moveaxis(self._memmap(), self._gradientAxis, -1)
+            for index in range(count):
+                yield index, array[..., index]
+        elif self._gradientAxis == 0:
+            for index, block in enumerate(self._blocks()):
+                yield index, block
+        else:
+            volumeBytes = int(numpy.prod(self.shape[:3])) * self.dtype.itemsize
+            for batch in self._batches(count, volumeBytes):
+                gathered = numpy.empty((batch.stop - batch.start,) + self.shape[:3], dtype=self.dtype)
+                for k, block in enumerate(self._blocks()):
+                    gathered[:, k] = numpy.moveaxis(block, self._gradientAxis - 1, 0)[batch]
+                for offset, volume in enumerate(gathered):
+                    yield batch.start + offset, volume
+
+    def slices(self):
+        """ Yield (k, slice indexed [j, i, gradient]) for every slice along the slowest image axis, in order """
+        count = self.shape[0]
+        if self.encoding == 'raw':
+            array = numpy.moveaxis(self._memmap(), self._gradientAxis, -1)
+            for k in range(count):
+                yield k, array[k]
+        elif self._gradientAxis != 0:
+            for k, block in enumerate(self._blocks()):
+                yield k, numpy.moveaxis(block, self._gradientAxis - 1, -1)
+        else:
+            sliceBytes = int(numpy.prod(self.shape[1:])) * self.dtype.itemsize
+            for batch in self._batches(count, sliceBytes):
+                gathered = numpy.empty((batch.stop - batch.start,) + self.shape[1:], dtype=self.dtype)
+                for index, block in enumerate(self._blocks()):
+                    gathered[..., index] = block[batch]
+                for offset, block in enumerate(gathered):
+                    yield batch.start + offset, block
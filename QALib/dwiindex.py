@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+""" Index the gradient scheme of every DWI NRRD referenced by the dwi_raw and dwi_images queues, reading only
+    the file headers in a process pool, so that protocol deviations can be found in bulk, e.g.
+
+    QA_DB_CONFIG=database.cfg python -m QALib.dwiindex --output dwi_headers.sqlite
+
+    The index is a CSV file, or a SQLite database (table dwi_headers) if the output ends in .sqlite or .db
+"""
+import csv
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import time
+from multiprocessing.pool import ThreadPool
+
+from . import openQueue
+from .batch import argumentParser, directoryCache, dwiLocators, parseArguments
+from .dwi_raw.gradients import gradientMetrics
+from .dwi_raw.reader import readHeader
+
+QUEUES = ('dwi_raw', 'dwi_images')
+
+COLUMNS = ('queue', 'record_id', 'path', 'file_size', 'mtime', 'gradients', 'baselines', 'b_values', 'sizes',
+           'spacing', 'header_sha1', 'error')
+
+
+def referencedFiles(client, locate, threads=16):
+    """ Return [(record_id, NRRD file), ...] of every record of a queue, resolving the files in a thread pool """
+    rows = client.allRecords()
+    pool = ThreadPool(threads)
+    try:
+        paths = pool.map(locate, rows, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+    return [(row['record_id'], path) for row, path in zip(rows, paths) if path is not None]
+
+
+def indexFile(path):
+    """ Return the index entry {column: value} of a DWI file, with the error message if it cannot be read.
+        Runs in the worker processes
+    """
+    entry = dict.fromkeys(COLUMNS[2:])
+    entry['path'] = path
+    try:
+        stat = os.stat(path)
+        entry['file_size'], entry['mtime'] = stat.st_size, stat.st_mtime
+        header = readHeader(path)
+        gradients, bValue = header.gradients(), header.bValue()
+        metrics = gradientMetrics(gradients, bValue)
+        entry['gradients'] = metrics.count
+        entry['baselines'] = metrics.baselines
+        entry['b_values'] = ' '.join('%g' % b for b, count in metrics.shells)
+        entry['sizes'] = ' '.join(str(size) for size in header.sizes())
+        entry['spacing'] = ' '.join('%g' % spacing for spacing in header.spacing())
+        entry['header_sha1'] = hashlib.sha1(header.text).hexdigest()
+    except Exception as error:
+        entry['error'] = str(error)
+    return entry
+
+
+def indexFiles(paths, processes=None, chunksize=16):
+    """ Return {path: index entry} of the listed files, parsing the headers in a process pool """
+    paths = sorted(set(paths))
+    pool = multiprocessing.Pool(processes)
+    try:
+        return dict((entry['path'], entry) for entry in pool.imap_unordered(indexFile, paths, chunksize))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def writeIndex(output, records, entries):
+    """ Write one index row per (queue, record_id, path) of `records`, taking the file values from `entries` """
+    rows = []
+    for queue, recordID, path in records:
+        entry = dict(entries[path], queue=queue, record_id=recordID)
+        rows.append(tuple(entry[column] for column in COLUMNS))
+    if os.path.splitext(output)[1] in ('.sqlite', '.db'):
+        connection = sqlite3.connect(output)
+        try:
+            connection.execute("CREATE TABLE IF NOT EXISTS dwi_headers ({0}, PRIMARY KEY (queue, record_id))".format(
+                ', '.join(COLUMNS)))
+            connection.executemany("INSERT OR REPLACE INTO dwi_headers ({0}) VALUES ({1})".format(
+                ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))), rows)
+            connection.commit()
+        finally:
+            connection.close()
+    else:
+        with open(output, 'wb') as fID:
+            writer = csv.writer(fID)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argumentParser("Index the gradient scheme of every DWI file of the review queues", QUEUES, 'index')
+    parser.add_argument('--output', default='dwi_headers.csv',
+                        help="The index file, SQLite if it ends in .sqlite or .db (default: dwi_headers.csv)")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Number of header parsing processes (default: one per CPU)")
+    parser.add_argument('--threads', type=int, default=16, help="Number of file locating threads")
+    args, databaseConfig = parseArguments(parser, argv, QUEUES)
+    locators = dwiLocators(directoryCache())
+
+    login = os.environ.get('USER', 'dwiindex')
+    records = []
+    for queue in args.queues:
+        defaults, locate = locators[queue]
+        client = openQueue(databaseConfig, defaults, login)
+        files = referencedFiles(client, locate, args.threads)
+        print "%s: %d file(s) found" % (client.queueTable, len(files))
+        records.extend((queue, recordID, path) for recordID, path in files)
+    start = time.time()
+    entries = indexFiles([path for queue, recordID, path in records], args.processes)
+    errors = [entry for entry in entries.values() if entry['error'] is not None]
+    print "Parsed %d header(s) in %.1f s, %d unreadable" % (len(entries), time.time() - start, len(errors))
+    for entry in errors:
+        print "  %s: %s" % (entry['path'], entry['error'])
+    print "Wrote %d row(s) to %s" % (writeIndex(args.output, records, entries), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+""" Automated reviewer of the dwi_raw queue: look for slice dropouts, interleaved volumes and bad baselines in
+    every unreviewed raw DWI and write the answers as a review by the automated reviewer, without changing
+    the record status.  The DWI Raw Inspection module shows them to the reviewer who claims the record when
+    the reviewer_id of the automated reviewer is set as auto_reviewer_id in the [Queue:dwi_raw] section, e.g.
+
+    QA_DB_CONFIG=database.cfg python -m QALib.dwirater --reviewer dwiRater --dry-run
+"""
+import multiprocessing
+import time
+
+from . import openQueue
+from .batch import argumentParser, directoryCache, dwiRawLocator, parseArguments
+from .dwi_raw import helper as dwiRaw
+from .dwi_raw.artifacts import detectArtifacts, reviewValues
+from .dwi_raw.reader import readGradients
+from .dwi_raw.voxels import DWIReader
+
+
+def rateFile(item):
+    """ Return (record_id, review values or None, error message or None) of a (record_id, raw DWI file) pair.
+        Runs in the worker processes
+    """
+    recordID, path = item
+    try:
+        gradients, bValue = readGradients(path)
+        # Read slice by slice, so the memory used does not grow with the scan
+        data = DWIReader(path)
+        return recordID, reviewValues(gradients, detectArtifacts(data, gradients, bValue)), None
+    except Exception as error:
+        return recordID, None, str(error)
+
+
+def rateFiles(items, processes=None):
+    """ Rate the (record_id, file) pairs in a process pool, yielding the results of rateFile() as they finish """
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(rateFile, items):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(argv=None):
+    parser = argumentParser("Review the artifacts of the unreviewed raw DWIs automatically")
+    parser.add_argument('--reviewer', default='dwiRater',
+                        help="Login of the automated reviewer in the reviewers table (default: dwiRater)")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Number of rating processes (default: one per CPU)")
+    parser.add_argument('--all', action='store_true', help="Rate again the records the reviewer already rated")
+    parser.add_argument('--dry-run', action='store_true', help="Report the answers without writing them")
+    args, databaseConfig = parseArguments(parser, argv)
+    client = openQueue(databaseConfig, dwiRaw.QUEUE, args.reviewer)
+    rated = set() if args.all else client.reviewedRecordIDs()
+    locate = dwiRawLocator(directoryCache())
+    items, missing = [], 0
+    for row in client.unreviewedRecords():
+        if row['record_id'] in rated:
+            continue
+        path = locate(row)
+        if path is not None:
+            items.append((row['record_id'], path))
+        else:
+            missing += 1
+    print "%s: %d record(s) to rate, %d without a file" % (client.queueTable, len(items), missing)
+
+    start = time.time()
+    written = failed = 0
+    for recordID, values, error in rateFiles(items, args.processes):
+        if values is None:
+            failed += 1
+            print "  record %s: %s" % (recordID, error)
+        elif args.dry_run:
+            print "  record %s: %s" % (recordID, values)
+        else:
+            client.addReview((recordID,) + values)
+            written += 1
+    print "Rated %d record(s) in %.1f s, %d failed, %d review(s) written" % (len(items) - failed,
+                                                                         time.time() - start, failed, written)
+
+
+if __name__ == '__main__':
+    main()
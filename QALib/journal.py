@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class ReviewJournal(object):
+    """ Durable local queue of reviews that have not been written to Postgres yet, kept in a
+        SQLite database in WAL mode so that a review survives a Slicer crash or a database outage.
+        A review is only removed once written; reviews the database refused are kept as conflicts
+    """
+
+    def __init__(self, path):
+        """
+        Arguments:
+        - `path`: The SQLite file to create or reopen
+        ------------------------
+        >>> journal = ReviewJournal(':memory:')
+        >>> journalID = journal.append((12, 1, 0, 'NULL'))
+        >>> journal.count() == 1 and journal.pending() == [(journalID, (12, 1, 0, 'NULL'))]
+        True
+        >>> journal.recordFailure(journalID, 'server closed the connection')
+        >>> journal.pending(maxAttempts=1)
+        []
+        >>> journal.failedCount(maxAttempts=1), journal.resetAttempts(), journal.failedCount(maxAttempts=1)
+        (1, 1, 0)
+        >>> journal.markConflict(journalID, 'record 12 is no longer locked')
+        >>> journal.pending(), journal.conflicts() == [(journalID, (12, 1, 0, 'NULL'), 'record 12 is no longer locked')]
+        ([], True)
+        >>> journal.remove(journalID); journal.count()
+        0
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS pending_reviews \
+                                  (journal_id INTEGER PRIMARY KEY AUTOINCREMENT, \
+                                   review_values TEXT NOT NULL, \
+                                   queued_time REAL NOT NULL, \
+                                   attempts INTEGER NOT NULL DEFAULT 0, \
+                                   last_error TEXT, \
+                                   conflict TEXT)")
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(pending_reviews)")]
+        if 'conflict' not in columns:  # Journal written before conflicts were kept
+            self._connection.execute("ALTER TABLE pending_reviews ADD COLUMN conflict TEXT")
+
+    def append(self, values):
+        """ Store a review tuple and return its journal_id """
+        with self._lock:
+            cursor = self._connection.execute("INSERT INTO pending_reviews (review_values, queued_time) VALUES (?, ?)",
+                                              (json.dumps(list(values)), time.time()))
+            return cursor.lastrowid
+
+    def pending(self, limit=100, maxAttempts=None):
+        """ Return up to `limit` (journal_id, values) pairs, oldest first, skipping the conflicts and the
+            reviews that already failed `maxAttempts` times
+        """
+        sqlCommand = "SELECT journal_id, review_values FROM pending_reviews WHERE conflict IS NULL"
+        params = ()
+        if maxAttempts is not None:
+            sqlCommand += " AND attempts < ?"
+            params = (maxAttempts,)
+        with self._lock:
+            rows = self._connection.execute(sqlCommand + " ORDER BY journal_id LIMIT %d" % limit, params).fetchall()
+        return [(journalID, tuple(json.loads(values))) for journalID, values in rows]
+
+    def pendingRecordIDs(self):
+        """ Return the record_ids (first review value) of every review still in the journal """
+        with self._lock:
+            rows = self._connection.execute("SELECT review_values FROM pending_reviews").fetchall()
+        return set(json.loads(values)[0] for values, in rows)
+
+    def conflicts(self):
+        """ Return the (journal_id, values, reason) of the reviews the database refused """
+        with self._lock:
+            rows = self._connection.execute("SELECT journal_id, review_values, conflict FROM pending_reviews \
+                                             WHERE conflict IS NOT NULL ORDER BY journal_id").fetchall()
+        return [(journalID, tuple(json.loads(values)), conflict) for journalID, values, conflict in rows]
+
+    def remove(self, journalID):
+        with self._lock:
+            self._connection.execute("DELETE FROM pending_reviews WHERE journal_id=?", (journalID,))
+
+    def recordFailure(self, journalID, error):
+        with self._lock:
+            self._connection.execute("UPDATE pending_reviews SET attempts=attempts + 1, last_error=? \
+                                      WHERE journal_id=?", (str(error), journalID))
+
+    def markConflict(self, journalID, reason):
+        """ Keep a review the database refused without retrying it, e.g. when its record is no longer locked """
+        with self._lock:
+            self._connection.execute("UPDATE pending_reviews SET conflict=? WHERE journal_id=?", (reason, journalID))
+
+    def resetAttempts(self):
+        """ Retry the reviews that failed too often, return how many there were """
+        with self._lock:
+            return self._connection.execute("UPDATE pending_reviews SET attempts=0 \
+                                             WHERE attempts > 0 AND conflict IS NULL").rowcount
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM pending_reviews").fetchone()[0]
+
+    def failedCount(self, maxAttempts):
+        """ The number of reviews no longer retried after `maxAttempts` failures """
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM pending_reviews \
+                                             WHERE conflict IS NULL AND attempts >= ?", (maxAttempts,)).fetchone()[0]
+
+    def conflictCount(self):
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM pending_reviews \
+                                             WHERE conflict IS NOT NULL").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ReviewWriter(threading.Thread):
+    """ Background thread that flushes the journal to Postgres with database.submitReview(), retrying with
+        an exponential back-off while the server is unreachable.  The GUI thread only appends to the journal.
+        Reviews that failed `maxAttempts` times are retried again when the writer starts next
+    """
+
+    def __init__(self, journal, database, retryDelay=2.0, maxRetryDelay=120.0, maxAttempts=20):
+        """
+        Arguments:
+        - `journal`: A ReviewJournal
+        - `database`: A QueueClient used only by this thread
+        - `retryDelay`: Seconds to wait after the first failed write, doubled on each consecutive failure
+        - `maxRetryDelay`: Upper bound of the back-off
+        - `maxAttempts`: Reviews failing this many times stay in the journal and are not retried before the
+                         next start
+        """
+        threading.Thread.__init__(self, name='ReviewWriter')
+        self.daemon = True
+        self.journal = journal
+        self.database = database
+        self.retryDelay = retryDelay
+        self.maxRetryDelay = maxRetryDelay
+        self.maxAttempts = maxAttempts
+        self.lastFlushLatency = None  # Seconds taken by the last successful write
+        self.lastFlushTime = None
+        self.lastError = None
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._stopping = False
+
+    def submit(self, values):
+        """ Journal a review and wake the writer """
+        journalID = self.journal.append(values)
+        self._idle.clear()
+        self._wake.set()
+        return journalID
+
+    def pendingCount(self):
+        """ The number of reviews still retried """
+        return self.journal.count() - self.failedCount() - self.conflictCount()
+
+    def failedCount(self):
+        return self.journal.failedCount(self.maxAttempts)
+
+    def conflictCount(self):
+        return self.journal.conflictCount()
+
+    def flush(self, timeout=None):
+        """ Keep the writer retrying, ignoring its back-off, for up to `timeout` seconds or until the journal
+            is drained.  Return True if it was
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.journal.pending(limit=1, maxAttempts=self.maxAttempts):
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                break
+            self._idle.clear()
+            self._wake.set()
+            self._idle.wait(remaining)
+        return self.journal.count() == 0
+
+    def stop(self, timeout=None):
+        self._stopping = True
+        self._wake.set()
+        self.join(timeout)
+
+    def _flushPending(self):
+        """ Write the journal to the database, return False on the first failure """
+        while not self._stopping:
+            batch = self.journal.pending(maxAttempts=self.maxAttempts)
+            if not batch:
+                return True
+            for journalID, values in batch:
+                start = time.time()
+                try:
+                    written = self.database.submitReview(values)
+                except Exception as error:
+                    _logger.warning("Could not write review for record %s: %s", values[0], error)
+                    self.lastError = str(error)
+                    self.journal.recordFailure(journalID, error)
+                    return False
+                if not written:
+                    # Replayed after a commit whose reply was lost, or the lock was released meanwhile: kept
+                    # in the journal for the reviewer to resolve, never written twice
+                    _logger.warning("Record %s is no longer locked, its review is kept as a conflict", values[0])
+                    self.journal.markConflict(journalID, "record %s is no longer locked" % values[0])
+                    continue
+                self.journal.remove(journalID)
+                self.lastFlushLatency = time.time() - start
+                self.lastFlushTime = time.time()
+                self.lastError = None
+        return True
+
+    def run(self):
+        retried = self.journal.resetAttempts()
+        if retried:
+            _logger.info("Retrying %d review(s) left in the journal", retried)
+        delay = self.retryDelay
+        while not self._stopping:
+            self._wake.clear()
+            if self._flushPending():
+                delay = self.retryDelay
+                self._idle.set()
+                self._wake.wait()
+            else:
+                self._idle.set()
+                self._wake.wait(delay)
+                delay = min(delay * 2, self.maxRetryDelay)
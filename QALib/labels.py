@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+""" Region masks of a combined label map (all_Labels_seg.nii.gz), found in a single linear pass over the voxels """
+import numpy
+
+
+def labelBoxes(array):
+    """ Locate every nonzero label of `array` in one pass and return {label: bounding box as a tuple of slices}.
+        Nothing is sorted: for every axis, the (label, coordinate) pairs present are counted with bincount, so the
+        cost is linear in the labeled voxels plus (label range x axis length)
+
+    >>> array = numpy.zeros((3, 4, 5), dtype=numpy.int16)
+    >>> array[1, 1:3, 2] = 7; array[0, 0, 4] = 2; array[2, 3, 0] = 7
+    >>> boxes = labelBoxes(array)
+    >>> sorted(boxes), boxes[7]
+    ([2, 7], (slice(1, 3, None), slice(1, 4, None), slice(0, 3, None)))
+    """
+    flatIndices = numpy.flatnonzero(array)
+    if not flatIndices.size:
+        return {}
+    values = array.ravel()[flatIndices].astype(numpy.intp)
+    offset = values.min()
+    values -= offset
+    labelCount = int(values.max()) + 1
+    lows, highs = [], []
+    for coordinates, length in zip(numpy.unravel_index(flatIndices, array.shape), array.shape):
+        # present[label, coordinate]: some voxel of the label lies on that plane of the axis
+        present = numpy.bincount(values * length + coordinates, minlength=labelCount * length)
+        present = present.reshape(labelCount, length) > 0
+        lows.append(present.argmax(axis=1))
+        highs.append(length - present[:, ::-1].argmax(axis=1))
+    labels = numpy.flatnonzero(present.any(axis=1))
+    boxes = {}
+    for label in labels:
+        boxes[int(label + offset)] = tuple(slice(int(low[label]), int(high[label])) for low, high in zip(lows, highs))
+    return boxes
+
+
+def regionMask(array, level, box):
+    """ Return the mask of `level` inside `box` only: 1 where `array[box]` == `level`, with the dtype of `array`
+
+    >>> array = numpy.array([[0, 3, 3], [1, 3, 0]])
+    >>> regionMask(array, 3, labelBoxes(array)[3])
+    array([[1, 1],
+           [1, 0]])
+    """
+    return (array[box] == level).astype(array.dtype)
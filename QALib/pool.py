@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+import socket
+import threading
+import time
+
+from . import pg8000, sql
+
+# Exceptions that mean a connection is no longer usable: a closed socket, or any pg8000 error such as the
+# ProgrammingError of a backend terminated by the server
+BROKEN_CONNECTION_ERRORS = (socket.error, pg8000.errors.Error)
+
+
+class ConnectionPool(object):
+    """ Keep a small number of warm connections to one Postgres database so that
+        consecutive calls from the postgresDatabase helpers do not each pay for
+        a full TCP connect and authentication
+    """
+
+    def __init__(self, host, port, database, user, password,
+                 maxSize=3, idleTimeout=300.0, checkInterval=30.0):
+        """
+        Arguments:
+        - `host`, `port`, `database`, `user`, `password`: The pg8000 connection arguments
+        - `maxSize`: The maximum number of idle connections kept open, one for each thread sharing the pool (the
+                     GUI, the ReviewWriter and the SessionPrefetcher of Derived Images)
+        - `idleTimeout`: Seconds after which an unused connection is closed
+        - `checkInterval`: Seconds of idleness after which a connection is verified with 'SELECT 1'
+                           before it is handed out again
+        ------------------------
+        >>> pool = ConnectionPool('localhost', 5432, 'test', 'test', 'test')
+        >>> pool.maxSize == 3 and pool.idleCount() == 0
+        True
+        """
+        self.host = host
+        self.port = port
+        self.database = database
+        self.user = user
+        self.password = password
+        self.maxSize = maxSize
+        self.idleTimeout = idleTimeout
+        self.checkInterval = checkInterval
+        self._idle = []  # (connection, lastUsed) pairs, most recently used last
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return sql.connect(host=self.host,
+                           port=self.port,
+                           database=self.database,
+                           user=self.user,
+                           password=self.password)
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except BROKEN_CONNECTION_ERRORS:
+            pass
+
+    def _isAlive(self, connection):
+        """ Run a trivial statement to verify that the server is still listening """
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            connection.rollback()
+        except BROKEN_CONNECTION_ERRORS:
+            return False
+        return True
+
+    def idleCount(self):
+        with self._lock:
+            return len(self._idle)
+
+    def acquire(self):
+        """ Return an open connection, reusing an idle one when it is still healthy """
+        while True:
+            now = time.time()
+            with self._lock:
+                expired = [pair for pair in self._idle if now - pair[1] > self.idleTimeout]
+                self._idle = [pair for pair in self._idle if now - pair[1] <= self.idleTimeout]
+                candidate = self._idle.pop() if self._idle else None
+            for connection, lastUsed in expired:
+                self._discard(connection)
+            if candidate is None:
+                return self._connect()
+            connection, lastUsed = candidate
+            if now - lastUsed < self.checkInterval or self._isAlive(connection):
+                return connection
+            # Broken socket (server restart, network drop...): throw it away and try the next one
+            self._discard(connection)
+
+    def release(self, connection):
+        """ Hand a connection back to the pool.  Any open transaction is rolled back; connections
+            that fail to roll back are assumed broken and closed instead of being reused
+        """
+        try:
+            connection.rollback()
+        except BROKEN_CONNECTION_ERRORS:
+            self._discard(connection)
+            return
+        with self._lock:
+            if len(self._idle) < self.maxSize:
+                self._idle.append((connection, time.time()))
+                return
+        self._discard(connection)
+
+    def closeAll(self):
+        """ Close every idle connection """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, lastUsed in idle:
+            self._discard(connection)
+
+
+_pools = {}
+_poolsLock = threading.Lock()
+
+
+def getPool(host, port, database, user, password, **kwds):
+    """ Return the pool shared by every helper connecting with the same arguments
+
+    >>> getPool('localhost', 5432, 'test', 'test', 'test') is getPool('localhost', 5432, 'test', 'test', 'test')
+    True
+    """
+    key = (host, port, database, user, password)
+    with _poolsLock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(host, port, database, user, password, **kwds)
+        return _pools[key]
+
+
+def closePools():
+    """ Close the idle connections of every shared pool, called by the exit() of the module logics """
+    with _poolsLock:
+        pools = _pools.values()
+    for pool in pools:
+        pool.closeAll()
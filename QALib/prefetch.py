@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+import collections
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+class PrefetchedSession(collections.namedtuple('PrefetchedSession', ('row', 'sessionFiles', 'volumes'))):
+    """ A claimed record, its resolved files and the {file name: decoded volume} read ahead of the reviewer """
+    __slots__ = ()
+
+    @property
+    def nbytes(self):
+        return sum(volume.nbytes for volume in self.volumes.values())
+
+
+class SessionPrefetcher(threading.Thread):
+    """ Background thread that claims the next complete records and reads their volumes while the current
+        session is being reviewed.  Only reading happens on this thread; the main thread takes a
+        PrefetchedSession and creates the MRML nodes from its decoded volumes
+    """
+
+    def __init__(self, database, resolve, images, read=None, depth=1, memoryBudget=1024 ** 3, retryDelay=30.0):
+        """
+        Arguments:
+        - `database`: A QueueClient used only by this thread
+        - `resolve`: The logic's constructFilePaths, returning the session files of a row or None
+        - `images`: The keys of the session files to read
+        - `read`: A function decoding a file, e.g. volumes.readVolume.  If None, records are only claimed ahead
+        - `depth`: The number of sessions kept ready
+        - `memoryBudget`: Bytes of decoded volumes kept ready; no session is read ahead beyond it
+        - `retryDelay`: Seconds to wait after the queue was empty or a claim failed
+        ------------------------
+        >>> class Queue(object):
+        ...   def claimCompleteRecord(self, resolve):
+        ...     return {'record_id': 1}, resolve({'record_id': 1})
+        >>> prefetcher = SessionPrefetcher(Queue(), lambda row: {'t1_average': 't1.nii.gz'}, ('t1_average',))
+        >>> prefetcher.start()
+        >>> prefetcher.take().sessionFiles
+        {'t1_average': 't1.nii.gz'}
+        >>> prefetcher.stop() in ([], [1])  # The next record may have been claimed ahead already
+        True
+        """
+        threading.Thread.__init__(self, name='SessionPrefetcher')
+        self.daemon = True
+        self.database = database
+        self.resolve = resolve
+        self.images = tuple(images)
+        self.read = read
+        self.depth = depth
+        self.memoryBudget = memoryBudget
+        self.retryDelay = retryDelay
+        self.lastError = None
+        self._ready = collections.deque()
+        self._condition = threading.Condition()
+        self._loading = False
+        self._lastSessionBytes = 0
+        self._stopping = False
+
+    def start(self):
+        # The first session is being read as soon as the thread runs; take() waits for it
+        self._loading = True
+        threading.Thread.start(self)
+
+    def readyBytes(self):
+        with self._condition:
+            return sum(session.nbytes for session in self._ready)
+
+    def _full(self):
+        if len(self._ready) >= self.depth:
+            return True
+        # Estimate the next session from the last one read
+        return self._ready and self.readyBytes() + self._lastSessionBytes > self.memoryBudget
+
+    def _prepare(self):
+        row, sessionFiles = self.database.claimCompleteRecord(self.resolve)
+        volumes = {}
+        if self.read is not None:
+            for image in self.images:
+                fileName = sessionFiles[image]
+                if fileName in volumes:
+                    continue
+                try:
+                    volumes[fileName] = self.read(fileName)
+                except Exception as error:
+                    # The main thread loads this file from disk itself
+                    _logger.warning("Could not read %s ahead: %s", fileName, error)
+        return PrefetchedSession(row, sessionFiles, volumes)
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and self._full():
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                self._loading = True
+            session = None
+            try:
+                session = self._prepare()
+                self.lastError = None
+            except Exception as error:
+                _logger.info("Nothing prefetched: %s", error)
+                self.lastError = str(error)
+            with self._condition:
+                self._loading = False
+                if session is not None:
+                    self._ready.append(session)
+                    self._lastSessionBytes = session.nbytes
+                self._condition.notify_all()
+                if session is None and not self._stopping:
+                    self._condition.wait(self.retryDelay)
+
+    def take(self):
+        """ Return the next PrefetchedSession, waiting for the one being read if any, or None """
+        with self._condition:
+            while not self._ready and self._loading:
+                self._condition.wait()
+            if not self._ready:
+                return None
+            session = self._ready.popleft()
+            self._condition.notify_all()
+            return session
+
+    def stop(self, timeout=None):
+        """ Stop the thread and return the record_ids claimed ahead and never taken, to be released """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self.join(timeout)
+        with self._condition:
+            recordIDs = [session.row['record_id'] for session in self._ready]
+            self._ready.clear()
+        return recordIDs
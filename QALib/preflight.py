@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+""" Pre-flight check of the review queues: find the unreviewed records whose input files are missing and
+    mark them 'M', so reviewers never claim them.  Meant to run nightly, e.g.
+
+    QA_MODULE_CONFIG=derived_images.cfg QA_DB_CONFIG=database.cfg python -m QALib.preflight --dry-run
+"""
+import ConfigParser as cParser
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+from . import openQueue, ResolutionTable
+from .batch import argumentParser, directoryCache, dwiImagesLocator, dwiRawLocator, parseArguments
+from .derived_images import helper as derivedImages
+from .dwi_preprocess import helper as dwiImages
+from .dwi_raw import helper as dwiRaw
+
+QUEUES = ('derived_images', 'dwi_raw', 'dwi_images')
+
+
+def derivedImagesChecker(moduleConfig, cache):
+    """ Return a function of a derived_images row giving its first missing image, or None """
+    table = ResolutionTable.fromConfig(moduleConfig, derivedImages.IMAGES, derivedImages.FALLBACKS)
+
+    def check(row):
+        files, missing = table.resolve(derivedImages.sessionDirectory(row), cache.find)
+        return missing
+    return check
+
+
+def dwiRawChecker(cache):
+    """ Return a function of a dwi_raw row giving its missing NRRD file, or None """
+    locate = dwiRawLocator(cache)
+
+    def check(row):
+        if locate(row) is None:
+            return dwiRaw.sessionFilePath(row)
+        return None
+    return check
+
+
+def dwiImagesChecker(cache):
+    """ Return a function of a dwi_images row giving its missing DTIPrep output, or None """
+    locate = dwiImagesLocator(cache)
+
+    def check(row):
+        if locate(row) is None:
+            return os.path.join(dwiImages.sessionDirectory(row), '*' + dwiImages.QCED_SUFFIX)
+        return None
+    return check
+
+
+def scan(client, check, threads=16):
+    """ Check every unreviewed record of a queue in a thread pool and return (number of records checked,
+        [(record_id, missing file or image), ...])
+    """
+    rows = client.unreviewedRecords()
+    pool = ThreadPool(threads)
+    try:
+        results = pool.map(check, rows, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+    return len(rows), [(row['record_id'], missing) for row, missing in zip(rows, results) if missing is not None]
+
+
+def markMissing(client, missing):
+    """ Set every listed record still unreviewed to 'M' in one statement, return the record_ids changed """
+    return client.markRecords([recordID for recordID, item in missing], 'M', fromStatus='U')
+
+
+def main(argv=None):
+    parser = argumentParser("Mark unreviewed records with missing input files as 'M'", QUEUES, 'check')
+    parser.add_argument('--module-config', default=os.environ.get('QA_MODULE_CONFIG'),
+                        help="Derived images module configuration (default: $QA_MODULE_CONFIG)")
+    parser.add_argument('--threads', type=int, default=16, help="Number of file checking threads")
+    parser.add_argument('--dry-run', action='store_true', help="Report the incomplete records without marking them")
+    args, databaseConfig = parseArguments(parser, argv, QUEUES)
+    cache = directoryCache()
+    checkers = {'dwi_raw': (dwiRaw.QUEUE, dwiRawChecker(cache), None),
+                'dwi_images': (dwiImages.QUEUE, dwiImagesChecker(cache), None)}
+    if 'derived_images' in args.queues:
+        moduleConfig = cParser.SafeConfigParser()
+        if args.module_config is None or not moduleConfig.read(args.module_config):
+            parser.error("The derived_images check needs the module configuration (--module-config)")
+        checkers['derived_images'] = (derivedImages.QUEUE, derivedImagesChecker(moduleConfig, cache), moduleConfig)
+
+    login = os.environ.get('USER', 'preflight')
+    for queue in args.queues:
+        defaults, check, moduleConfig = checkers[queue]
+        client = openQueue(databaseConfig, defaults, login, moduleConfig=moduleConfig)
+        start = time.time()
+        count, missing = scan(client, check, args.threads)
+        print "%s: %d unreviewed record(s), %d incomplete (%.1f s)" % (client.queueTable, count, len(missing),
+                                                                      time.time() - start)
+        if args.dry_run:
+            for recordID, item in missing:
+                print "  record %s: missing %s" % (recordID, item)
+        elif missing:
+            print "  marked %d record(s) 'M'" % len(markMissing(client, missing))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+import ast
+import logging
+
+from .backends import PostgresBackend, SQLiteBackend
+
+# Prefix of the automated (roboRater) review columns attached to claimed rows
+AUTO_PREFIX = 'auto_'
+
+_logger = logging.getLogger(__name__)
+
+
+class Row(tuple):
+    """ A result row that can be indexed by position or by column name
+
+    >>> row = Row({'record_id': 0, 'status': 1}, (12, 'L'))
+    >>> row[0] == row['record_id'] == 12 and row.get('priority') is None
+    True
+    """
+
+    def __new__(cls, index, values):
+        row = tuple.__new__(cls, values)
+        row._index = index  # Shared by every row of a result
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self._index:
+            return self[key]
+        return default
+
+    def keys(self):
+        return sorted(self._index, key=self._index.get)
+
+
+class QueueClient(object):
+    """ Claim records from a review queue table and record their reviews, preventing multiple user
+        collisions during simultaneous evaluations.  The tables and review columns are parameters and
+        the SQL dialect comes from the backend (PostgresBackend or SQLiteBackend)
+    """
+
+    def __init__(self, backend, queueTable, reviewTable, reviewColumns, login, arraySize=1, autoReviewerID=None):
+        """
+        Arguments:
+        - `backend`: A PostgresBackend or SQLiteBackend
+        - `queueTable`: The table of records to review, with record_id, status and priority columns
+        - `reviewTable`: The table the reviews are written to
+        - `reviewColumns`: The evaluation columns of `reviewTable`, in the order the widget reports them
+        - `login`: The reviewer login ID, normally $USER
+        - `arraySize`: The number of rows to claim at once
+        - `autoReviewerID`: The reviewer_id whose reviews are attached to claimed rows, or None
+        ------------------------
+        >>> client = QueueClient(SQLiteBackend(':memory:'), 'derived_images', 'image_reviews', ('t1_average', 'notes'), 'user1')
+        >>> client.arraySize == 1 and client.reviewer_id is None and client.rows is None
+        True
+        """
+        self.backend = backend
+        self.queueTable = queueTable
+        self.reviewTable = reviewTable
+        self.reviewColumns = tuple(reviewColumns)
+        self.login = login
+        self.arraySize = arraySize
+        self.autoReviewerID = autoReviewerID
+        self.reviewer_id = None
+        self.rows = None
+
+    def getReviewerID(self):
+        """ Using the database login name, get the reviewer_id key from the reviewers table """
+        reviewerID = self.backend.reviewerID(self.login)
+        if reviewerID is None:
+            raise self.backend.DataError("Reviewer %s is not registered in the database!" % self.login)
+        self.reviewer_id = reviewerID
+        return reviewerID
+
+    def claimBatch(self, count=None):
+        """ Atomically set the status of up to `count` (default self.arraySize) rows with status == 'U' to 'L'
+            and return them as Row objects.  If an automated reviewer is set, its review is attached as the
+            AUTO_PREFIX-ed review columns plus AUTO_PREFIX + 'review_id' (None when it has not rated the record)
+        """
+        if count is None:
+            count = self.arraySize
+        names, rows = self.backend.claim(self.queueTable, count, self.reviewTable, self.reviewColumns,
+                                         self.autoReviewerID, AUTO_PREFIX)
+        index = dict((name, position) for position, name in enumerate(names))
+        self.rows = [Row(index, row) for row in rows]
+        if not self.rows:
+            raise self.backend.DataError("No rows with status == 'U' were found in %s!" % self.queueTable)
+        return self.rows
+
+    def unreviewedRecords(self):
+        """ Return every row with status == 'U' as Row objects, without claiming them """
+        names, rows = self.backend.unreviewed(self.queueTable)
+        index = dict((name, position) for position, name in enumerate(names))
+        return [Row(index, row) for row in rows]
+
+    def allRecords(self):
+        """ Return every row of the queue, reviewed or not, as Row objects without claiming them """
+        names, rows = self.backend.records(self.queueTable)
+        index = dict((name, position) for position, name in enumerate(names))
+        return [Row(index, row) for row in rows]
+
+    def lockAndReadRecords(self):
+        """ Find a given number of records with status == 'U', set the status to 'L',
+            and return the records in a dictionary-like object
+        """
+        return self.claimBatch()
+
+    def submitReview(self, values):
+        """ Write the review values and set the record status to 'R' in a single transaction, so a review is
+            never recorded without its lock being released (or vice versa).  Return False, writing nothing, if
+            the record is no longer locked, e.g. when the review was already written.  The reviewer_id is cached
+
+        Arguments:
+        - `values`: The record_id followed by the reviewColumns values
+        """
+        if self.reviewer_id is None:
+            self.getReviewerID()
+        return self.backend.submit(self.queueTable, self.reviewTable, self.reviewColumns, values, self.reviewer_id)
+
+    def addReview(self, values):
+        """ Write a review without changing the status of its record, e.g. the answers of an automated reviewer
+            that are shown to whoever claims the record next
+
+        Arguments:
+        - `values`: The record_id followed by the reviewColumns values
+        """
+        if self.reviewer_id is None:
+            self.getReviewerID()
+        self.backend.insertReview(self.reviewTable, self.reviewColumns, values, self.reviewer_id)
+
+    def reviewedRecordIDs(self):
+        """ Return the set of record_ids this reviewer has reviewed """
+        if self.reviewer_id is None:
+            self.getReviewerID()
+        return set(self.backend.reviewedBy(self.reviewTable, self.reviewer_id))
+
+    def unlockRecord(self, status='U', pKey=None):
+        """ Unlock the record in the queue table by setting the status, dependent of the index value
+
+        Arguments:
+        - `pKey`: The value for the record_id column in the self.rows variable.
+                  If pKey > -1, set that record's flag to `status`.
+                  If pKey is None, then set the remaining, unreviewed rows to 'U'
+        """
+        if pKey is None:
+            self.unlockRecords()
+        else:
+            self.backend.setStatus(self.queueTable, [pKey], status)
+
+    def claimCompleteRecord(self, resolve, maxCandidates=255):
+        """ Claim records until one is found for which `resolve(row)` does not return None, and return
+            (row, resolved).  Candidates are claimed in doubling batches (1, 2, 4...), every unresolvable
+            candidate of a batch is marked 'M' with one statement, and the candidates claimed after the
+            returned one are released unchecked.  Raise IOError after `maxCandidates` unresolvable records
+
+        Arguments:
+        - `resolve`: A function of a claimed Row returning e.g. its session files, or None if any is missing
+        - `maxCandidates`: The bound on the number of records checked for one call
+        """
+        checked = 0
+        count = self.arraySize
+        while checked < maxCandidates:
+            rows = self.claimBatch(min(count, maxCandidates - checked))
+            missing = []
+            found = None
+            for position, row in enumerate(rows):
+                resolved = resolve(row)
+                if resolved is not None:
+                    found = (row, resolved)
+                    break
+                missing.append(row['record_id'])
+            checked += len(missing)
+            if missing:
+                _logger.info("Marking %d record(s) of %s as missing files", len(missing), self.queueTable)
+                self.markRecords(missing, 'M')
+            if found is not None:
+                unchecked = [row['record_id'] for row in rows[position + 1:]]
+                if unchecked:
+                    self.unlockRecords(unchecked)
+                self.rows = [found[0]]
+                return found
+            count *= 2
+        raise IOError("No complete record found in %d records claimed from %s" % (checked, self.queueTable))
+
+    def markRecords(self, recordIDs, status, fromStatus='L'):
+        """ Set the status of every listed record that currently has `fromStatus` in a single statement and
+            return the list of record_ids changed
+        """
+        recordIDs = [int(recordID) for recordID in recordIDs]
+        if not recordIDs:
+            return []
+        return self.backend.setStatus(self.queueTable, recordIDs, status, fromStatus)
+
+    def unlockRecords(self, recordIDs=None):
+        """ Set the status of every record in `recordIDs` that is still locked back to 'U' with a single
+            statement and return the list of record_ids actually released
+
+        Arguments:
+        - `recordIDs`: An iterable of record_id values.  If None, release the rows of the last claim
+        """
+        if recordIDs is None:
+            recordIDs = [row['record_id'] for row in (self.rows or [])]
+        return self.markRecords(recordIDs, 'U')
+
+
+def _literal(value):
+    """ Config values are written with str() of Python literals (see writeConfigFile.py) """
+    if isinstance(value, basestring):
+        return ast.literal_eval(value)
+    return value
+
+
+def openQueue(databaseConfig, defaults, login, arraySize=1, moduleConfig=None):
+    """ Create a QueueClient for one module
+
+    Arguments:
+    - `databaseConfig`: A ConfigParser with either a [Postgres] section (Host, Port, Database, User, Password
+                        and optional Schema) or a [SQLite] section with a Path
+    - `defaults`: The module's queue settings: 'schema', 'queue_table', 'review_table', 'review_columns'
+                  and 'auto_reviewer_id'
+    - `login`: The reviewer login ID
+    - `arraySize`: The number of rows to claim at once
+    - `moduleConfig`: An optional ConfigParser whose [Queue] section overrides `defaults`
+
+    In both configurations, a [Queue:<queue_table>] section (e.g. [Queue:dwi_raw]) overrides [Queue] for the
+    module whose default queue table it names only, as the DWI modules share autoworkup.cfg
+    ------------------------
+    >>> import ConfigParser
+    >>> config = ConfigParser.SafeConfigParser()
+    >>> config.add_section('SQLite'); config.set('SQLite', 'Path', ':memory:')
+    >>> config.add_section('Queue'); config.set('Queue', 'review_columns', "['question_one', 'comments']")
+    >>> client = openQueue(config, {'queue_table': 'dwi_raw', 'review_table': 'dwi_raw_reviews', 'review_columns': ()}, 'user1')
+    >>> client.reviewColumns == ('question_one', 'comments') and client.autoReviewerID is None
+    True
+    >>> config.add_section('Queue:dwi_raw'); config.set('Queue:dwi_raw', 'auto_reviewer_id', '10')
+    >>> openQueue(config, {'queue_table': 'dwi_raw', 'review_table': 'dwi_raw_reviews'}, 'user1').autoReviewerID
+    10
+    >>> openQueue(config, {'queue_table': 'dwi_images', 'review_table': 'dwi_reviews'}, 'user1').autoReviewerID is None
+    True
+    >>> postgres = ConfigParser.SafeConfigParser(); postgres.add_section('Postgres')
+    >>> openQueue(postgres, {'schema': None, 'queue_table': 'dwi_images'}, 'user1')
+    Traceback (most recent call last):
+    ...
+    ValueError: The dwi_images queue has no schema: set Schema in the [Postgres] section
+    """
+    settings = dict(defaults)
+    sections = ('Queue', 'Queue:{0}'.format(defaults['queue_table']))
+    for config in (databaseConfig, moduleConfig):
+        for section in sections:
+            if config is not None and config.has_section(section):
+                settings.update(config.items(section))
+    if databaseConfig.has_option('Postgres', 'Schema'):
+        settings['schema'] = databaseConfig.get('Postgres', 'Schema')
+    if databaseConfig.has_section('SQLite'):
+        backend = SQLiteBackend(databaseConfig.get('SQLite', 'Path'))
+    else:
+        if not settings.get('schema'):
+            raise ValueError("The {0} queue has no schema: set Schema in the [Postgres] section".format(
+                settings['queue_table']))
+        backend = PostgresBackend(host=databaseConfig.get('Postgres', 'Host'),
+                                  port=databaseConfig.getint('Postgres', 'Port'),
+                                  database=databaseConfig.get('Postgres', 'Database'),
+                                  user=databaseConfig.get('Postgres', 'User'),
+                                  password=databaseConfig.get('Postgres', 'Password'),
+                                  schema=settings['schema'])
+    return QueueClient(backend,
+                       settings['queue_table'],
+                       settings['review_table'],
+                       _literal(settings['review_columns']),
+                       login,
+                       arraySize,
+                       _literal(settings.get('auto_reviewer_id')))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+""" Build the quick look volumes (mean baseline, mean and maximum diffusion weighted) of the DWI files of the
+    unreviewed dwi_raw and dwi_images records ahead of the reviewers, so the DWI modules show them first and
+    load the 4D image afterwards.  Use the quicklook_directory of the [Cache] section the modules read, e.g.
+
+    QA_DB_CONFIG=autoworkup.cfg python -m QALib.quicklook --processes 8
+"""
+import multiprocessing
+import os
+import time
+
+from . import openQueue
+from .batch import argumentParser, directoryCache, dwiLocators, parseArguments
+from .dwi_raw.summary import openQuickLookCache
+
+QUEUES = ('dwi_raw', 'dwi_images')
+
+
+def buildQuickLook(item):
+    """ Return (DWI file, error message or None) after building the quick looks of a (QuickLookCache, DWI file)
+        pair.  Runs in the worker processes
+    """
+    cache, path = item
+    try:
+        cache.build(path)
+        return path, None
+    except Exception as error:
+        return path, str(error)
+
+
+def main(argv=None):
+    parser = argumentParser("Build the quick look volumes of the DWIs waiting for review", QUEUES, 'prepare')
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Number of building processes (default: one per CPU)")
+    args, databaseConfig = parseArguments(parser, argv, QUEUES)
+    quickLooks = openQuickLookCache(databaseConfig)
+    if quickLooks is None:
+        parser.error("Quick looks are disabled in the [Cache] section of {0}".format(args.database))
+    locators = dwiLocators(directoryCache())
+
+    login = os.environ.get('USER', 'quicklook')
+    paths = set()
+    for queue in args.queues:
+        defaults, locate = locators[queue]
+        client = openQueue(databaseConfig, defaults, login)
+        found = [path for path in map(locate, client.unreviewedRecords()) if path is not None]
+        todo = [path for path in found if quickLooks.lookup(path) is None]
+        print "%s: %d file(s), %d without quick looks" % (client.queueTable, len(found), len(todo))
+        paths.update(todo)
+
+    start = time.time()
+    failed = 0
+    pool = multiprocessing.Pool(args.processes)
+    try:
+        for path, error in pool.imap_unordered(buildQuickLook, [(quickLooks, path) for path in sorted(paths)]):
+            if error is not None:
+                failed += 1
+                print "  %s: %s" % (path, error)
+    finally:
+        pool.close()
+        pool.join()
+    print "Built the quick looks of %d file(s) in %.1f s in %s, %d failed" % (len(paths) - failed,
+                                                                            time.time() - start,
+                                                                            quickLooks.directory, failed)
+
+
+if __name__ == '__main__':
+    main()
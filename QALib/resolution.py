@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+import ast
+import collections
+import os
+
+
+class ImageRule(collections.namedtuple('ImageRule', ('image', 'candidates', 'fallback', 'label'))):
+    """ How one image of a session is found:
+
+    - `image`: The image (config section) name
+    - `candidates`: Paths relative to the session directory, in the order they are tried
+    - `fallback`: The absolute path used when no candidate exists, or None if the image is required
+    - `label`: The level of the region in all_Labels_seg.nii.gz, or None
+    """
+    __slots__ = ()
+
+
+def _literalList(config, section, option):
+    """ Parse a list of strings written by writeConfigFile.py, e.g. "['TissueClassify']" """
+    text = config.get(section, option)
+    try:
+        value = ast.literal_eval(text)
+    except (SyntaxError, ValueError):
+        raise ValueError("[{0}] {1} is not a Python literal: {2}".format(section, option, text))
+    if isinstance(value, basestring):
+        value = [value]
+    if not isinstance(value, (list, tuple)) or not value or \
+       not all(isinstance(item, basestring) and item for item in value):
+        raise ValueError("[{0}] {1} must be a non-empty list of names: {2}".format(section, option, text))
+    for item in value:
+        if os.path.isabs(item) or os.pardir in item.split(os.sep):
+            raise ValueError("[{0}] {1} must be relative to the session directory: {2}".format(section, option, item))
+    return tuple(value)
+
+
+class ResolutionTable(object):
+    """ The module configuration compiled once into an immutable table of ImageRules, so that resolving a
+        session is a lookup and a malformed configuration fails when the module starts
+    """
+
+    def __init__(self, rules):
+        """
+        Arguments:
+        - `rules`: An iterable of ImageRule, in the order images are resolved
+        ------------------------
+        >>> import ConfigParser
+        >>> config = ConfigParser.RawConfigParser()
+        >>> config.add_section('t2_average'); config.set('t2_average', 'directories', "['TissueClassify']")
+        >>> config.set('t2_average', 'filenames', "['t2_average_BRAINSABC.nii.gz']")
+        >>> config.add_section('caudate_left'); config.set('caudate_left', 'directories', "['a', 'b']")
+        >>> config.set('caudate_left', 'filenames', "['all_Labels_seg.nii.gz']"); config.set('caudate_left', 'label', '1')
+        >>> table = ResolutionTable.fromConfig(config, ('t2_average', 'caudate_left'), {'t2_average': 'empty.nii.gz'})
+        >>> table.rule('caudate_left').candidates, table.rule('caudate_left').label
+        (('a/all_Labels_seg.nii.gz', 'b/all_Labels_seg.nii.gz'), 1)
+        >>> files, missing = table.resolve('ses', lambda paths: ([path for path in paths if path.startswith('ses/b')] + [None])[0])
+        >>> files['t2_average'], files['caudate_left'], missing
+        ('empty.nii.gz', 'ses/b/all_Labels_seg.nii.gz', None)
+        >>> table.resolve('ses', lambda paths: None)
+        ({'t2_average': 'empty.nii.gz'}, 'caudate_left')
+        >>> config.set('caudate_left', 'label', 'left')
+        >>> ResolutionTable.fromConfig(config, ('caudate_left',))
+        Traceback (most recent call last):
+        ...
+        ValueError: [caudate_left] label must be an integer: left
+        """
+        self.rules = tuple(rules)
+        self._byImage = dict((rule.image, rule) for rule in self.rules)
+
+    @classmethod
+    def fromConfig(cls, config, images, fallbacks=None):
+        """ Compile the [image] sections of a module configuration (see writeConfigFile.py)
+
+        Arguments:
+        - `config`: A ConfigParser with 'directories', 'filenames' and optional 'label' options per image
+        - `images`: The image names, in resolution order
+        - `fallbacks`: An optional {image: path} of files used when an image is not found
+        """
+        fallbacks = fallbacks or {}
+        rules = []
+        for image in images:
+            if not config.has_section(image):
+                raise ValueError("Module configuration has no [{0}] section".format(image))
+            directories = _literalList(config, image, 'directories')
+            filenames = _literalList(config, image, 'filenames')
+            label = None
+            if config.has_option(image, 'label'):
+                text = config.get(image, 'label')
+                try:
+                    label = ast.literal_eval(text)
+                except (SyntaxError, ValueError):
+                    label = text
+                if not isinstance(label, int) or isinstance(label, bool):
+                    raise ValueError("[{0}] label must be an integer: {1}".format(image, text))
+            candidates = tuple(os.path.join(directory, filename) for directory in directories for filename in filenames)
+            rules.append(ImageRule(image, candidates, fallbacks.get(image), label))
+        return cls(rules)
+
+    def rule(self, image):
+        return self._byImage[image]
+
+    def resolve(self, sessionDirectory, find):
+        """ Return ({image: path}, None) for a session, or (the images resolved so far, first missing image)
+
+        Arguments:
+        - `sessionDirectory`: The directory the candidate paths are relative to
+        - `find`: A function returning the first existing path of a list, or None (e.g. DirectoryCache.find)
+        """
+        files = {}
+        for rule in self.rules:
+            path = find([os.path.join(sessionDirectory, candidate) for candidate in rule.candidates])
+            if path is None:
+                path = rule.fallback
+            if path is None:
+                return files, rule.image
+            files[rule.image] = path
+        return files, None
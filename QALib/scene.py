@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+import collections
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class SessionNodeRegistry(object):
+    """ The MRML nodes each reviewed session added to the scene, so that sessions falling out of a small LRU
+        window are removed with their display and storage nodes instead of piling up for the whole Slicer run
+    """
+
+    def __init__(self, scene, window=2):
+        """
+        Arguments:
+        - `scene`: The MRML scene, i.e. slicer.mrmlScene
+        - `window`: The number of most recent sessions kept in the scene (2 = current and previous)
+        ------------------------
+        >>> class Node(object):
+        ...   def __init__(self, nodeID): self.nodeID = nodeID
+        ...   def GetID(self): return self.nodeID
+        >>> class Scene(dict):
+        ...   def GetNodeByID(self, nodeID): return self.get(nodeID)
+        ...   def RemoveNode(self, node): del self[node.GetID()]
+        >>> scene = Scene((nodeID, Node(nodeID)) for nodeID in ('vol1', 'vol2', 'vol3'))
+        >>> registry = SessionNodeRegistry(scene, window=2)
+        >>> for session, nodeID in (('s1', 'vol1'), ('s2', 'vol2'), ('s3', 'vol3')):
+        ...   evicted = registry.activate(session); node = registry.register(session, scene[nodeID])
+        >>> sorted(scene), registry.sessions()
+        (['vol2', 'vol3'], ['s2', 's3'])
+        """
+        self.scene = scene
+        self.window = window
+        self._sessions = collections.OrderedDict()  # session -> [node IDs], least recently used first
+
+    def sessions(self):
+        return list(self._sessions)
+
+    def register(self, session, node):
+        """ Record that `node` belongs to `session` and return it """
+        if node is not None:
+            nodeIDs = self._sessions.setdefault(session, [])
+            if node.GetID() not in nodeIDs:
+                nodeIDs.append(node.GetID())
+        return node
+
+    def activate(self, session):
+        """ Make `session` the most recent one and evict the sessions outside the window, return the evicted """
+        self._sessions[session] = self._sessions.pop(session, [])
+        evicted = []
+        while len(self._sessions) > max(self.window, 1):
+            oldSession, nodeIDs = self._sessions.popitem(last=False)
+            for nodeID in nodeIDs:
+                self._removeNode(nodeID)
+            evicted.append(oldSession)
+            _logger.info("Removed %d node(s) of session %s from the scene", len(nodeIDs), oldSession)
+        return evicted
+
+    def _removeNode(self, nodeID):
+        node = self.scene.GetNodeByID(nodeID)
+        if node is None:
+            return
+        related = []
+        if hasattr(node, 'GetNumberOfDisplayNodes'):
+            related.extend(node.GetNthDisplayNode(index) for index in range(node.GetNumberOfDisplayNodes()))
+        if hasattr(node, 'GetStorageNode'):
+            related.append(node.GetStorageNode())
+        self.scene.RemoveNode(node)
+        for relatedNode in related:
+            if relatedNode is not None and self.scene.GetNodeByID(relatedNode.GetID()) is not None:
+                self.scene.RemoveNode(relatedNode)
+
+    def memoryBytes(self):
+        """ Return the bytes of image data held by the registered nodes still in the scene """
+        total = 0
+        for nodeIDs in self._sessions.values():
+            for nodeID in nodeIDs:
+                node = self.scene.GetNodeByID(nodeID)
+                if node is not None and hasattr(node, 'GetImageData') and node.GetImageData() is not None:
+                    total += node.GetImageData().GetActualMemorySize() * 1024  # Reported in kibibytes
+        return total
+
+    def describe(self):
+        """ A one line summary for the module panel """
+        return 'Scene: %d session(s), %.0f MB of images' % (len(self._sessions), self.memoryBytes() / 1024.0 ** 2)
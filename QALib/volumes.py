@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+""" Decode volume files off the main thread and hand the decoded voxels to the MRML scene on it.
+    SimpleITK reads and decompresses the file (it releases the GIL while doing so); only pushVolume()
+    touches the scene and must be called from the Slicer main thread.  VolumeCache keeps decompressed
+    copies of the files on local scratch
+"""
+import collections
+import hashlib
+import logging
+import os
+import Queue
+import threading
+import time
+
+try:
+    from __main__ import slicer
+    from __main__ import vtk
+except:
+    pass
+
+try:
+    import numpy
+    import SimpleITK as sitk
+except ImportError:
+    sitk = None
+
+_logger = logging.getLogger(__name__)
+
+
+class DecodedVolume(collections.namedtuple('DecodedVolume', ('array', 'spacing', 'origin', 'direction'))):
+    """ The voxels of a volume file as a numpy array indexed [k, j, i], with its LPS geometry """
+    __slots__ = ()
+
+    @property
+    def nbytes(self):
+        return self.array.nbytes
+
+
+def canRead():
+    """ True if volumes can be decoded outside of the MRML scene """
+    return sitk is not None
+
+
+def readVolume(fileName):
+    """ Read and decompress a volume file into a DecodedVolume.  Safe to call from a worker thread """
+    if sitk is None:
+        raise ImportError("SimpleITK is required to read volumes outside of the MRML scene")
+    return _decoded(sitk.ReadImage(fileName))
+
+
+def _decoded(image):
+    return DecodedVolume(sitk.GetArrayFromImage(image), image.GetSpacing(), image.GetOrigin(), image.GetDirection())
+
+
+def _volumeNode(nodeName, array):
+    """ Create a volume node named `nodeName` holding a copy of `array`, indexed [k, j, i] """
+    from vtk.util import numpy_support
+    array = numpy.ascontiguousarray(array)
+    imageData = vtk.vtkImageData()
+    imageData.SetDimensions(*reversed(array.shape))
+    imageData.GetPointData().SetScalars(numpy_support.numpy_to_vtk(array.ravel(), deep=True))
+    volumeNode = slicer.vtkMRMLScalarVolumeNode()
+    volumeNode.SetName(nodeName)
+    volumeNode.SetAndObserveImageData(imageData)
+    return volumeNode
+
+
+def pushVolume(nodeName, volume, labelMap=False):
+    """ Create a volume node named `nodeName` from a DecodedVolume and add it to the scene, on the main thread """
+    volumeNode = _volumeNode(nodeName, volume.array)
+    volumeNode.SetSpacing(*volume.spacing)
+    # ITK geometry is LPS, MRML is RAS
+    volumeNode.SetOrigin(-volume.origin[0], -volume.origin[1], volume.origin[2])
+    direction = numpy.array(volume.direction).reshape(3, 3) * numpy.array([[-1.0], [-1.0], [1.0]])
+    volumeNode.SetIJKToRASDirections(*direction.T.ravel())
+    return _addToScene(volumeNode, labelMap)
+
+
+def pushRegion(nodeName, array, referenceNode, box):
+    """ Create a label node named `nodeName` from `array`, the voxels of `referenceNode` inside `box` (slices
+        [k, j, i]), and add it to the scene where the box lies in the reference volume, on the main thread
+    """
+    volumeNode = _volumeNode(nodeName, array)
+    ijkToRAS = vtk.vtkMatrix4x4()
+    referenceNode.GetIJKToRASMatrix(ijkToRAS)
+    volumeNode.SetIJKToRASMatrix(ijkToRAS)
+    corner = ijkToRAS.MultiplyPoint((box[2].start, box[1].start, box[0].start, 1.0))
+    volumeNode.SetOrigin(*corner[:3])
+    return _addToScene(volumeNode, labelMap=True)
+
+
+def _addToScene(volumeNode, labelMap):
+    """ Give `volumeNode` a display node and add both to the scene """
+    if labelMap:
+        volumeNode.SetLabelMap(1)
+        displayNode = slicer.vtkMRMLLabelMapVolumeDisplayNode()
+        colorNodeID = 'vtkMRMLColorTableNodeLabels'
+    else:
+        displayNode = slicer.vtkMRMLScalarVolumeDisplayNode()
+        colorNodeID = 'vtkMRMLColorTableNodeGrey'
+    slicer.mrmlScene.AddNode(displayNode)
+    displayNode.SetAndObserveColorNodeID(colorNodeID)
+    if not labelMap:
+        displayNode.AutoWindowLevelOn()
+    volumeNode.SetAndObserveDisplayNodeID(displayNode.GetID())
+    slicer.mrmlScene.AddNode(volumeNode)
+    return volumeNode
+
+
+class VolumeCache(object):
+    """ Uncompressed copies of compressed volume files (.nii.gz, .nrrd with gzip encoding) on fast local scratch,
+        so a file is decompressed once however often it is shown.  Entries are keyed by source path, size and
+        mtime, stored as raw NRRD files that can be memory-mapped, and evicted least recently used first once the
+        cache grows past `maxBytes`.  Files left half written by a Slicer that died while filling the cache are
+        removed when it is opened
+    """
+
+    def __init__(self, directory, maxBytes=8 * 1024 ** 3, staleAfter=3600.0):
+        """
+        Arguments:
+        - `directory`: The cache directory, created if needed
+        - `maxBytes`: The size the cache is kept under
+        - `staleAfter`: The age in seconds after which a temporary file is left over, not being written by another
+          Slicer sharing the directory
+        ------------------------
+        >>> import tempfile, time
+        >>> directory = tempfile.mkdtemp()
+        >>> leftOver = os.path.join(directory, 'key.tmp1.nrrd')
+        >>> open(leftOver, 'w').close()
+        >>> os.utime(leftOver, (time.time() - 7200, time.time() - 7200))
+        >>> cache = VolumeCache(directory, maxBytes=1024)
+        >>> os.path.exists(leftOver)
+        False
+        >>> source = os.path.join(cache.directory, 'source.nii.gz')
+        >>> open(source, 'w').close()
+        >>> cache.lookup(source) is None and (cache.hits, cache.misses) == (0, 1)
+        True
+        """
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> bytes, least recently used first
+        self._pending = set()
+        self._fillQueue = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        cached = []
+        now = time.time()
+        for name in os.listdir(directory):
+            if not name.endswith('.nrrd'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+                if '.tmp' not in name:
+                    cached.append((stat.st_mtime, name[:-len('.nrrd')], stat.st_size))
+                elif now - stat.st_mtime > staleAfter:
+                    os.remove(path)
+            except OSError:  # Renamed or removed by another Slicer meanwhile
+                pass
+        for mtime, key, size in sorted(cached):
+            self._entries[key] = size
+
+    def size(self):
+        with self._lock:
+            return sum(self._entries.values())
+
+    def _key(self, fileName):
+        fileName = os.path.abspath(fileName)
+        stat = os.stat(fileName)
+        return hashlib.sha1('{0}|{1}|{2!r}'.format(fileName, stat.st_size, stat.st_mtime)).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.nrrd')
+
+    def lookup(self, fileName):
+        """ Return the uncompressed copy of `fileName`, or None on a miss """
+        key = self._key(fileName)
+        with self._lock:
+            if key in self._entries and os.path.exists(self._path(key)):
+                self._entries[key] = self._entries.pop(key)
+                self.hits += 1
+                hit = True
+            else:
+                self._entries.pop(key, None)
+                self.misses += 1
+                hit = False
+        if not hit:
+            return None
+        os.utime(self._path(key), None)  # Keeps the LRU order across Slicer runs
+        return self._path(key)
+
+    def store(self, fileName, image=None):
+        """ Write the uncompressed copy of `fileName` into the cache and return its DecodedVolume.  The file is
+            decompressed unless it was already read into the SimpleITK `image`
+        """
+        if sitk is None:
+            raise ImportError("SimpleITK is required to fill the volume cache")
+        key = self._key(fileName)
+        if image is None:
+            image = sitk.ReadImage(fileName)
+        # SimpleITK chooses the writer from the extension
+        temporary = os.path.join(self.directory, '%s.tmp%d.nrrd' % (key, threading.current_thread().ident))
+        sitk.WriteImage(image, temporary, False)  # No compression
+        os.rename(temporary, self._path(key))
+        with self._lock:
+            self._entries[key] = os.path.getsize(self._path(key))
+        self._evict()
+        return _decoded(image)
+
+    def _evict(self):
+        with self._lock:
+            total = sum(self._entries.values())
+            while total > self.maxBytes and len(self._entries) > 1:
+                key, size = self._entries.popitem(last=False)
+                total -= size
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+
+    def readVolume(self, fileName, storeLater=False):
+        """ readVolume() through the cache: the uncompressed copy on a hit, otherwise decompress and store.  With
+            `storeLater`, as on the main thread, the decompressed image is returned at once and written to the cache
+            by a background thread, without being decompressed a second time
+        """
+        cached = self.lookup(fileName)
+        if cached is not None:
+            return readVolume(cached)
+        if not storeLater:
+            return self.store(fileName)
+        if sitk is None:
+            raise ImportError("SimpleITK is required to read volumes outside of the MRML scene")
+        image = sitk.ReadImage(fileName)
+        self.fillLater(fileName, image)
+        return _decoded(image)
+
+    def fillLater(self, fileName, image=None):
+        """ Store `fileName` from a background thread, from its SimpleITK `image` if the caller already read it """
+        if sitk is None:
+            return
+        with self._lock:
+            if fileName in self._pending:
+                return
+            self._pending.add(fileName)
+            if self._fillQueue is None:
+                self._fillQueue = Queue.Queue()
+                worker = threading.Thread(target=self._fill, name='VolumeCacheFill')
+                worker.daemon = True
+                worker.start()
+        self._fillQueue.put((fileName, image))
+
+    def _fill(self):
+        while True:
+            fileName, image = self._fillQueue.get()
+            try:
+                self.store(fileName, image)
+            except Exception as error:
+                _logger.warning("Could not cache %s: %s", fileName, error)
+            with self._lock:
+                self._pending.discard(fileName)
+
+    def describe(self):
+        return 'cache: %d hit(s), %d miss(es), %.0f MB' % (self.hits, self.misses, self.size() / 1024.0 ** 2)
@@ -0,0 +1,28 @@
+-- Partial indexes over the unreviewed part of each review queue.
+--
+-- PostgresBackend.claim() picks the next records with
+--   ... WHERE status = 'U' ORDER BY priority, record_id LIMIT ? FOR UPDATE SKIP LOCKED
+-- Without these indexes Postgres sorts the whole unreviewed queue on every claim; with them
+-- the claim is a short index scan.  Reviewed rows drop out of the index, so it stays small.
+--
+-- The queues live in the schema set as Schema in the [Postgres] section of the database configuration
+-- (autoworkup_scm unless it is set; dwi_images has no default and needs it).  Pass that schema as the psql
+-- variable `schema`.  CREATE INDEX CONCURRENTLY cannot run inside a transaction block; apply with
+--   psql -h <host> -U <user> -d <database> -v schema=<Schema> -f 001_unreviewed_priority_index.sql
+-- Requires Postgres 9.5 or newer (also required by SKIP LOCKED).
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS derived_images_unreviewed_priority_idx
+    ON :"schema".derived_images (priority, record_id)
+    WHERE status = 'U';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS dwi_raw_unreviewed_priority_idx
+    ON :"schema".dwi_raw (priority, record_id)
+    WHERE status = 'U';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS dwi_images_unreviewed_priority_idx
+    ON :"schema".dwi_images (priority, record_id)
+    WHERE status = 'U';
+
+ANALYZE :"schema".derived_images;
+ANALYZE :"schema".dwi_raw;
+ANALYZE :"schema".dwi_images;
@@ -0,0 +1,78 @@
+import csv
+import os
+import sqlite3
+
+from QALib import QueueClient, SQLiteBackend
+from QALib.batch import dwiImagesLocator, dwiRawLocator
+from QALib.dircache import DirectoryCache
+from QALib.dwiindex import COLUMNS, indexFiles, referencedFiles, writeIndex
+from QALib.dwi_preprocess import helper as dwiImages
+from QALib.dwi_raw import helper as dwiRaw
+from queueTestCase import queueTestCase
+
+
+class dwiIndexTest(queueTestCase):
+    """ Index a temporary DWI header and an unreadable file, referenced by the dwi_raw and dwi_images records of
+        the SQLite schema in Testing/databaseSQL.txt
+    """
+    def setUp(self):
+        queueTestCase.setUp(self)
+        self.dwi = os.path.join(self.directory, 'dwi.nhdr')
+        with open(self.dwi, 'w') as fID:
+            fID.write('NRRD0005\nsizes: 4 4 2 3\nspace directions: (2,0,0) (0,2,0) (0,0,2.5) none\n'
+                      'DWMRI_b-value:=1000\nDWMRI_gradient_0000:=0 0 0\nDWMRI_gradient_0001:=1 0 0\n'
+                      'DWMRI_gradient_0002:=0 1 0\n')
+        self.broken = os.path.join(self.directory, 'broken.nrrd')
+        open(self.broken, 'w').close()
+        # The files of the first and the reviewed record of each queue are on disk
+        for queueTable in ('dwi_raw', 'dwi_images'):
+            self.execute("UPDATE {0} SET location=? WHERE record_id=1 OR status='R'".format(queueTable),
+                         (self.directory,))
+
+    def touch(self, path):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+        return path
+
+    def test_referencedRawFiles(self):
+        client = QueueClient(SQLiteBackend(self.path), 'dwi_raw', 'dwi_raw_reviews', dwiRaw.REVIEW_COLUMNS, 'ttest')
+        expected = [(row['record_id'], self.touch(dwiRaw.sessionFilePath(row))) for row in client.allRecords()
+                    if row['location'] == self.directory]
+        files = referencedFiles(client, dwiRawLocator(DirectoryCache()), threads=2)
+        assert files == expected and [recordID for recordID, path in files] == [1, 4]  # Reviewed records too
+
+    def test_referencedQCedFiles(self):
+        client = QueueClient(SQLiteBackend(self.path), 'dwi_images', 'dwi_reviews', dwiImages.REVIEW_COLUMNS,
+                             'ttest')
+        expected = []
+        for row in client.allRecords():
+            if row['location'] == self.directory:
+                qced = os.path.join(dwiImages.sessionDirectory(row), row['_session'] + dwiImages.QCED_SUFFIX)
+                expected.append((row['record_id'], self.touch(qced)))
+        files = referencedFiles(client, dwiImagesLocator(DirectoryCache()), threads=2)
+        assert files == expected and [recordID for recordID, path in files] == [1, 3]
+
+    def test_indexFiles(self):
+        entries = indexFiles([self.dwi, self.broken, self.dwi], processes=2)
+        assert sorted(entries) == sorted([self.dwi, self.broken])
+        entry = entries[self.dwi]
+        assert (entry['gradients'], entry['baselines'], entry['b_values']) == (3, 1, '1000')
+        assert (entry['sizes'], entry['spacing'], entry['error']) == ('4 4 2 3', '2 2 2.5', None)
+        assert entries[self.broken]['error'] is not None
+
+    def test_writeIndex(self):
+        entries = indexFiles([self.dwi], processes=1)
+        records = [('dwi_raw', 1, self.dwi), ('dwi_images', 1, self.dwi)]
+        output = os.path.join(self.directory, 'index.sqlite')
+        writeIndex(output, records, entries)
+        assert writeIndex(output, records, entries) == 2  # Rerunning replaces the rows
+        connection = sqlite3.connect(output)
+        try:
+            assert connection.execute("SELECT COUNT(*) FROM dwi_headers").fetchone()[0] == 2
+        finally:
+            connection.close()
+        output = os.path.join(self.directory, 'index.csv')
+        writeIndex(output, records, entries)
+        rows = list(csv.reader(open(output, 'rb')))
+        assert tuple(rows[0]) == COLUMNS and len(rows) == 3
@@ -0,0 +1,40 @@
+import ConfigParser
+import os
+
+from QALib import QueueClient, SQLiteBackend
+from QALib.preflight import derivedImagesChecker, markMissing, scan
+from QALib.derived_images.helper import IMAGES, REVIEW_COLUMNS
+from QALib.dircache import DirectoryCache
+from queueTestCase import queueTestCase
+
+
+class preflightTest(queueTestCase):
+    """ Check the derived_images queue of the SQLite schema in Testing/databaseSQL.txt against a temporary
+        data tree holding the files of a single session
+    """
+    def setUp(self):
+        queueTestCase.setUp(self)
+        self.execute("UPDATE derived_images SET location=? WHERE record_id=2", (self.directory,))
+        self.config = ConfigParser.RawConfigParser()
+        for image in IMAGES:
+            self.config.add_section(image)
+            self.config.set(image, 'directories', "['Images']")
+            self.config.set(image, 'filenames', "['{0}.nii.gz']".format(image))
+        sessionDirectory = os.path.join(self.directory, 'B4AUTO.20120524_Results', 'FMRI_HD_024', '0137', '48954',
+                                        'Images')
+        os.makedirs(sessionDirectory)
+        for image in IMAGES:
+            if image != 't2_average':  # T1-only session
+                open(os.path.join(sessionDirectory, image + '.nii.gz'), 'w').close()
+        self.client = QueueClient(SQLiteBackend(self.path), 'derived_images', 'image_reviews', REVIEW_COLUMNS, 'ttest')
+
+    def test_scanFindsIncompleteSessions(self):
+        count, missing = scan(self.client, derivedImagesChecker(self.config, DirectoryCache()), threads=2)
+        assert count == 4
+        assert sorted(recordID for recordID, image in missing) == [1, 3, 4]
+
+    def test_markMissing(self):
+        count, missing = scan(self.client, derivedImagesChecker(self.config, DirectoryCache()), threads=2)
+        self.client.claimBatch()  # Record 1 is claimed by a reviewer meanwhile and must stay locked
+        assert sorted(markMissing(self.client, missing)) == [3, 4]
+        assert [self.status(recordID) for recordID in range(1, 5)] == ['L', 'U', 'M', 'M']
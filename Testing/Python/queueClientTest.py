@@ -0,0 +1,74 @@
+from QALib import QueueClient, ReviewJournal, ReviewWriter, SQLiteBackend
+from QALib.derived_images.helper import REVIEW_COLUMNS
+from queueTestCase import queueTestCase
+
+
+class queueClientTest(queueTestCase):
+    """ Exercise the review queue offline against the SQLite schema in Testing/databaseSQL.txt """
+    def setUp(self):
+        queueTestCase.setUp(self)
+        self.client = QueueClient(SQLiteBackend(self.path), 'derived_images', 'image_reviews', REVIEW_COLUMNS,
+                                  'ttest', arraySize=2, autoReviewerID=1)
+
+    def test_claimLocksRows(self):
+        rows = self.client.claimBatch()
+        assert len(rows) == 2
+        for row in rows:
+            assert row['status'] == 'L' and self.status(row['record_id']) == 'L'
+            assert 'auto_review_id' in row.keys()
+
+    def test_claimsDoNotOverlap(self):
+        other = QueueClient(SQLiteBackend(self.path), 'derived_images', 'image_reviews', REVIEW_COLUMNS, 'ttest', 2)
+        first = set(row['record_id'] for row in self.client.claimBatch())
+        second = set(row['record_id'] for row in other.claimBatch())
+        assert not first & second
+
+    def test_submitReviewReleasesLock(self):
+        row = self.client.claimBatch()[0]
+        self.client.submitReview((row['record_id'],) + (1,) * (len(REVIEW_COLUMNS) - 1) + ('NULL',))
+        assert self.status(row['record_id']) == 'R'
+
+    def test_submitReviewIsWrittenOnce(self):
+        row = self.client.claimBatch()[0]
+        values = (row['record_id'],) + (1,) * (len(REVIEW_COLUMNS) - 1) + ('NULL',)
+        assert self.client.submitReview(values)
+        # A replay of the journal after a lost reply
+        assert not self.client.submitReview(values)
+        assert self.execute("SELECT count(*) FROM image_reviews WHERE record_id=?", (row['record_id'],)) == [(1,)]
+
+    def test_writerKeepsRefusedReviews(self):
+        row = self.client.claimBatch()[0]
+        self.client.unlockRecords()  # A stale lock released before the review is written
+        writer = ReviewWriter(ReviewJournal(':memory:'), self.client)
+        writer.start()
+        writer.submit((row['record_id'],) + (1,) * (len(REVIEW_COLUMNS) - 1) + ('NULL',))
+        assert not writer.flush(timeout=10.0)
+        writer.stop(timeout=10.0)
+        conflicts = writer.journal.conflicts()
+        assert writer.pendingCount() == 0 and [values[0] for journalID, values, reason in conflicts] == [row['record_id']]
+        assert self.execute("SELECT count(*) FROM image_reviews WHERE record_id=?", (row['record_id'],)) == [(0,)]
+
+    def test_addReviewKeepsStatus(self):
+        self.client.addReview((1,) + (0,) * (len(REVIEW_COLUMNS) - 1) + ('automated',))
+        assert self.status(1) == 'U' and self.client.reviewedRecordIDs() == set([1])
+        # Attached to the claimed row when 'ttest' is the automated reviewer
+        rater = QueueClient(SQLiteBackend(self.path), 'derived_images', 'image_reviews', REVIEW_COLUMNS, 'ttest',
+                            autoReviewerID=self.client.reviewer_id)
+        row = rater.claimBatch()[0]
+        assert row['record_id'] == 1 and row['auto_' + REVIEW_COLUMNS[-1]] == 'automated'
+
+    def test_unlockRecords(self):
+        rows = self.client.claimBatch()
+        released = self.client.unlockRecords()
+        assert sorted(released) == sorted(row['record_id'] for row in rows)
+        assert self.client.unlockRecords() == []
+
+    def test_claimCompleteRecordMarksMissing(self):
+        resolve = lambda row: row['record_id'] if row['record_id'] == 3 else None
+        row, resolved = self.client.claimCompleteRecord(resolve)
+        assert resolved == 3 and [row['record_id'] for row in self.client.rows] == [3]
+        assert [self.status(recordID) for recordID in range(1, 5)] == ['M', 'M', 'L', 'U']
+
+    def test_claimCompleteRecordIsBounded(self):
+        self.assertRaises(IOError, self.client.claimCompleteRecord, lambda row: None, 3)
+        assert [self.status(recordID) for recordID in range(1, 5)] == ['M', 'M', 'M', 'U']
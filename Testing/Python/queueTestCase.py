@@ -0,0 +1,38 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+
+class queueTestCase(unittest.TestCase):
+    """ Base of the tests run offline against a SQLite copy of the review database in Testing/databaseSQL.txt,
+        created in a temporary directory (self.directory) as self.path
+    """
+    schema = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'databaseSQL.txt')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'queue.sqlite')
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.executescript(open(self.schema).read())
+            connection.commit()
+        finally:
+            connection.close()
+
+    def execute(self, sqlCommand, params=()):
+        """ Run one statement on the database and return its rows """
+        connection = sqlite3.connect(self.path)
+        try:
+            rows = connection.execute(sqlCommand, params).fetchall()
+            connection.commit()
+        finally:
+            connection.close()
+        return rows
+
+    def status(self, recordID, queueTable='derived_images'):
+        return self.execute("SELECT status FROM {0} WHERE record_id=?".format(queueTable), (recordID,))[0][0]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)